@@ -2,7 +2,7 @@ import socket, json
 import os
 from tool.common_protocol import send_json, recv_json, send_file, recv_file
 from server_client import ServerClient
-from tool.file_manager import FileManager, list_games
+from tool.file_manager import FileManager, list_games, get_catalog
 from tool.game import game_print
 from template.create_template import create_template
 
@@ -149,6 +149,7 @@ class DeveloperClient:
         # Write JSON back to file
         with open(config_path, "w", encoding="utf-8") as f:
             json.dump(game, f, indent=4, ensure_ascii=False)
+        get_catalog("games").invalidate()
 
         return True
 
@@ -3,8 +3,9 @@ import socket
 import pygame
 import threading
 import queue
-from tool.common_protocol import send_json, recv_json
+from tool.common_protocol import send_json, recv_json, set_nodelay, hello
 from display import Display
+from frames import apply_frame
 
 
 class ReceiverThread(threading.Thread):
@@ -44,6 +45,8 @@ def player_run(ip, port):
     
     try:
         sock.connect((ip, port))
+        set_nodelay(sock)
+        hello(sock)
         print("[PLAYER] Connected!")
     except Exception as e:
         print(f"[PLAYER] Connection failed: {e}")
@@ -83,12 +86,12 @@ def player_run(ip, port):
         # Process all pending messages
         msg = receiver.get_message()
         while msg:
-            if msg["action"] == "frame":
+            if msg["action"] in ("keyframe", "delta"):
                 my_key = f"p{role}"
                 opp_key = f"p{3-role}"
 
-                game_state = msg[my_key]
-                opponent_state = msg[opp_key]
+                game_state = apply_frame(game_state, msg[my_key])
+                opponent_state = apply_frame(opponent_state, msg[opp_key])
 
             elif msg["action"] == "game_over":
                 game_over_result = msg["result"]
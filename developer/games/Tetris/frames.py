@@ -0,0 +1,128 @@
+# frames.py
+"""
+Frame protocol between the Tetris server and its clients.
+
+Instead of both full boards every frame, the server sends
+    {"action": "keyframe", "p1": state, "p2": state}
+every KEYFRAME_INTERVAL frames, where state is TetrisGame.get_game_state(),
+and in between only what changed:
+    {"action": "delta", "p1": delta, "p2": delta}
+A delta holds the changed cells as a flat [x, y, value, ...] list under
+"cells", "pos": [x, y] when only the falling piece moved, "current" when
+the piece itself changed (spawn, rotation, lock), and the changed stat
+fields. Frames where nothing changed are not sent at all.
+"""
+from tetris_logic import BOARD_WIDTH
+
+KEYFRAME_INTERVAL = 40      # frames between keyframes (2 s at 20 FPS)
+
+# state fields besides board / current, sent when they change
+STAT_FIELDS = ("score", "speed", "lines", "level", "gameover")
+
+
+# ==================================================
+#                  Server side
+# ==================================================
+
+class FrameEncoder:
+    """Turns successive frames of one game into keyframes and deltas."""
+    def __init__(self, game, player_id, oppo_id):
+        self.game = game
+        self.player_id = player_id
+        self.oppo_id = oppo_id
+        self.board = None       # rows as last sent
+        self.current = None     # (type, rot, x, y) as last sent
+        self.stats = None
+
+    def keyframe(self) -> dict:
+        state = self.game.get_game_state(self.player_id, self.oppo_id)
+        self.board = [row[:] for row in self.game.board]
+        self.current = _piece_key(self.game.current)
+        self.stats = {k: state[k] for k in STAT_FIELDS}
+        return state
+
+    def delta(self) -> dict:
+        """What changed since the last frame ({} if nothing did)."""
+        game = self.game
+        delta = {}
+
+        cells = []
+        for y, row in enumerate(game.board):
+            sent = self.board[y]
+            if row != sent:
+                for x in range(BOARD_WIDTH):
+                    if row[x] != sent[x]:
+                        cells += (x, y, row[x])
+                self.board[y] = row[:]
+        if cells:
+            delta["cells"] = cells
+
+        current = _piece_key(game.current)
+        if current != self.current:
+            if current and self.current and current[:2] == self.current[:2]:
+                delta["pos"] = [current[2], current[3]]
+            else:
+                delta["current"] = game.current.to_dict() if game.current else None
+            self.current = current
+
+        state = game.get_stats()
+        for k in STAT_FIELDS:
+            if state[k] != self.stats[k]:
+                delta[k] = self.stats[k] = state[k]
+        return delta
+
+
+class FrameStream:
+    """Frames of both players of a match, as the messages to send."""
+    def __init__(self, g1, g2, keyframe_interval=KEYFRAME_INTERVAL):
+        self.encoders = (FrameEncoder(g1, "P1", "P2"), FrameEncoder(g2, "P2", "P1"))
+        self.keyframe_interval = keyframe_interval
+        self.count = 0
+
+    def next(self):
+        """Message for this frame, or None if nothing changed."""
+        e1, e2 = self.encoders
+        self.count += 1
+        if self.count == 1 or self.count % self.keyframe_interval == 0:
+            return {"action": "keyframe", "p1": e1.keyframe(), "p2": e2.keyframe()}
+
+        d1, d2 = e1.delta(), e2.delta()
+        if not d1 and not d2:
+            return None
+        return {"action": "delta", "p1": d1, "p2": d2}
+
+
+def _piece_key(piece):
+    return (piece.type, piece.rot, piece.x, piece.y) if piece else None
+
+
+# ==================================================
+#                  Client side
+# ==================================================
+
+def apply_frame(state, frame) -> dict:
+    """
+    State of one player after a keyframe or delta part of a frame message.
+    Returns the new state (a keyframe replaces it, a delta updates it in
+    place). Deltas before the first keyframe are ignored.
+    """
+    if "board" in frame:
+        return frame
+    if not state:
+        return state
+
+    cells = frame.get("cells")
+    if cells:
+        board = state["board"]
+        for i in range(0, len(cells), 3):
+            board[cells[i + 1]][cells[i]] = cells[i + 2]
+
+    if "current" in frame:
+        state["current"] = frame["current"]
+    elif "pos" in frame and state.get("current"):
+        state["current"]["x"], state["current"]["y"] = frame["pos"]
+
+    for k in STAT_FIELDS:
+        if k in frame:
+            state[k] = frame[k]
+    return state
@@ -1,6 +1,5 @@
 # tetris_logic.py
 import random
-import copy
 
 BOARD_WIDTH = 10
 BOARD_HEIGHT = 20
@@ -32,6 +31,68 @@ SHAPES = [
 def rotate_matrix(mat):
     return [list(row) for row in zip(*mat[::-1])]
 
+# -------------------------
+# Bitboard
+# -------------------------
+# Every board row is also kept as an int with bit PAD + x set when cell x
+# is taken. PAD wall bits on both sides make pieces that stick out of the
+# board collide like any other cell, so a collision test is one shift and
+# one AND per piece row.
+PAD = 4
+WALLS = ((1 << PAD) - 1) | (((1 << PAD) - 1) << (PAD + BOARD_WIDTH))
+EMPTY_ROW = WALLS
+FULL_ROW = (1 << (BOARD_WIDTH + 2 * PAD)) - 1
+
+def shape_mask(shape):
+    """Row bitmasks of a shape matrix (bit j for column j)."""
+    return tuple(sum(1 << j for j, v in enumerate(row) if v) for row in shape)
+
+# The 4 rotations of every piece (repeated rotate_matrix, as tuples) and
+# their masks, computed once and shared by all pieces of all games.
+ROTATIONS = []
+for _shape in SHAPES:
+    _turns = [_shape]
+    for _ in range(3):
+        _turns.append(rotate_matrix(_turns[-1]))
+    ROTATIONS.append(tuple(tuple(tuple(row) for row in turn) for turn in _turns))
+ROTATIONS = tuple(ROTATIONS)
+ROTATION_MASKS = tuple(tuple(shape_mask(turn) for turn in turns) for turns in ROTATIONS)
+
+# wall kicks tried by rotate, in order
+KICKS = ((0, 0), (-1, 0), (1, 0), (0, -1))
+
+
+class Piece:
+    """
+    The falling piece: rotation state rot of piece type at (x, y). Shape
+    and mask come from the shared rotation tables, so moving, rotating
+    and spawning only change four ints.
+    """
+    __slots__ = ('type', 'rot', 'x', 'y')
+
+    def __init__(self, type=0, rot=0, x=0, y=0):
+        self.type = type
+        self.rot = rot
+        self.x = x
+        self.y = y
+
+    @property
+    def shape(self):
+        return ROTATIONS[self.type][self.rot]
+
+    @property
+    def mask(self):
+        return ROTATION_MASKS[self.type][self.rot]
+
+    def to_dict(self):
+        """The piece as sent to clients (see TetrisGame.get_game_state)."""
+        return {
+            'shape': [list(row) for row in self.shape],
+            'x': self.x,
+            'y': self.y,
+            'type': self.type
+        }
+
 class PieceBag:
     """
     Implements the 7-bag randomizer system.
@@ -57,12 +118,14 @@ class PieceBag:
 class TetrisGame:
     def __init__(self, seed=None):
         self.board = [[-1]*BOARD_WIDTH for _ in range(BOARD_HEIGHT)]  # -1 = empty, 0..6 = color/piece id
+        self.rows = [EMPTY_ROW] * BOARD_HEIGHT  # the same board as bitmasks (see PAD)
         self.score = 0
         self.level = 0
         self.lines = 0
         self.gameover = False
 
-        self.current = None   # dict: {'type':int, 'shape':matrix, 'x':int, 'y':int}
+        self.current = None   # Piece falling now, None between lock and spawn
+        self.piece = Piece()  # the one Piece object current points to
         self.piece_bag = PieceBag(seed=seed)
         self.next_type = self.piece_bag.draw()
         self.spawn_piece()
@@ -73,74 +136,77 @@ class TetrisGame:
     def spawn_piece(self):
         t = self.next_type
         self.next_type = self.piece_bag.draw()
-        shape = copy.deepcopy(SHAPES[t])
-        x = (BOARD_WIDTH - len(shape[0])) // 2
-        y = 0
-        self.current = {'type': t, 'shape': shape, 'x': x, 'y': y}
-        if self._collision(self.current['x'], self.current['y'], self.current['shape']):
+        p = self.piece
+        p.type = t
+        p.rot = 0
+        p.x = (BOARD_WIDTH - len(ROTATIONS[t][0][0])) // 2
+        p.y = 0
+        self.current = p
+        if self._collision(p.x, p.y, p.mask):
             self.gameover = True
 
-    def _collision(self, x, y, shape):
-        for i, row in enumerate(shape):
-            for j, v in enumerate(row):
-                if not v:
-                    continue
-                nx = x + j
-                ny = y + i
-                if nx < 0 or nx >= BOARD_WIDTH or ny < 0 or ny >= BOARD_HEIGHT:
-                    return True
-                if self.board[ny][nx] != -1:
-                    return True
+    def _collision(self, x, y, mask):
+        """Whether a piece with row masks mask at (x, y) hits a wall, the floor or a block."""
+        if y < 0 or y + len(mask) > BOARD_HEIGHT or not -PAD <= x < BOARD_WIDTH:
+            return True
+        shift = x + PAD
+        rows = self.rows
+        for i, m in enumerate(mask):
+            if rows[y + i] & (m << shift):
+                return True
         return False
 
     def rotate(self):
-        if not self.current or self.gameover:
+        p = self.current
+        if not p or self.gameover:
             return
-        new_shape = rotate_matrix(self.current['shape'])
-        # try wall kicks: (0,0), (-1,0), (1,0), (0,-1)
-        kicks = [(0,0),(-1,0),(1,0),(0,-1)]
-        for dx,dy in kicks:
-            nx = self.current['x'] + dx
-            ny = self.current['y'] + dy
-            if not self._collision(nx, ny, new_shape):
-                self.current['shape'] = new_shape
-                self.current['x'] = nx
-                self.current['y'] = ny
+        rot = (p.rot + 1) & 3
+        new_mask = ROTATION_MASKS[p.type][rot]
+        for dx, dy in KICKS:
+            if not self._collision(p.x + dx, p.y + dy, new_mask):
+                p.rot = rot
+                p.x += dx
+                p.y += dy
                 return
 
     def move(self, dx):
-        if not self.current or self.gameover:
+        p = self.current
+        if not p or self.gameover:
             return
-        nx = self.current['x'] + dx
-        if not self._collision(nx, self.current['y'], self.current['shape']):
-            self.current['x'] = nx
+        if not self._collision(p.x + dx, p.y, p.mask):
+            p.x += dx
 
     def soft_drop(self):
-        if not self.current or self.gameover:
+        p = self.current
+        if not p or self.gameover:
             return
-        ny = self.current['y'] + 1
-        if not self._collision(self.current['x'], ny, self.current['shape']):
-            self.current['y'] = ny
+        if not self._collision(p.x, p.y + 1, p.mask):
+            p.y += 1
         else:
             self.lock_piece()
 
     def hard_drop(self):
-        if not self.current or self.gameover:
+        p = self.current
+        if not p or self.gameover:
             return
-        while not self._collision(self.current['x'], self.current['y'] + 1, self.current['shape']):
-            self.current['y'] += 1
+        mask = p.mask
+        while not self._collision(p.x, p.y + 1, mask):
+            p.y += 1
         self.lock_piece()
 
     def lock_piece(self):
         s = self.current
-        for i, row in enumerate(s['shape']):
-            for j, v in enumerate(row):
-                if not v:
-                    continue
-                bx = s['x'] + j
-                by = s['y'] + i
-                if 0 <= by < BOARD_HEIGHT and 0 <= bx < BOARD_WIDTH:
-                    self.board[by][bx] = s['type']
+        shift = s.x + PAD
+        for i, m in enumerate(s.mask):
+            by = s.y + i
+            if not 0 <= by < BOARD_HEIGHT:
+                continue
+            bits = (m << shift) & ~WALLS
+            self.rows[by] |= bits
+            row = self.board[by]
+            for bx in range(BOARD_WIDTH):
+                if bits >> (bx + PAD) & 1:
+                    row[bx] = s.type
         self.current = None
         cleared = self.clear_lines()
         if cleared:
@@ -151,11 +217,11 @@ class TetrisGame:
         self.spawn_piece()
 
     def clear_lines(self):
-        new_board = [row for row in self.board if any(cell == -1 for cell in row)]
-        removed = BOARD_HEIGHT - len(new_board)
-        for _ in range(removed):
-            new_board.insert(0, [-1]*BOARD_WIDTH)
-        self.board = new_board
+        keep = [y for y in range(BOARD_HEIGHT) if self.rows[y] != FULL_ROW]
+        removed = BOARD_HEIGHT - len(keep)
+        if removed:
+            self.rows = [EMPTY_ROW] * removed + [self.rows[y] for y in keep]
+            self.board = [[-1]*BOARD_WIDTH for _ in range(removed)] + [self.board[y] for y in keep]
         return removed
 
     def update(self):
@@ -182,19 +248,20 @@ class TetrisGame:
         state = {
             'board': [row[:] for row in self.board],
             'current': None,
-            'score': self.score,
-            'speed': max(0.0, 1.0 - (10 - self.drop_interval_ticks)/10.0),  # normalized-ish
             'player_id': player_id or '',
             'oppo_id': oppo_id or '',
+        }
+        state.update(self.get_stats())
+        if self.current:
+            state['current'] = self.current.to_dict()
+        return state
+
+    def get_stats(self):
+        """The score / speed fields of get_game_state, without copying the board."""
+        return {
+            'score': self.score,
+            'speed': max(0.0, 1.0 - (10 - self.drop_interval_ticks)/10.0),  # normalized-ish
             'gameover': self.gameover,
             'lines': self.lines,
             'level': max(0, (self.lines // 10))
         }
-        if self.current:
-            state['current'] = {
-                'shape': [row[:] for row in self.current['shape']],
-                'x': self.current['x'],
-                'y': self.current['y'],
-                'type': self.current['type']
-            }
-        return state
\ No newline at end of file
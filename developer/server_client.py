@@ -1,7 +1,7 @@
 import socket
 import json
 import os
-from tool.common_protocol import send_json, recv_json, send_file, recv_file
+from tool.common_protocol import send_json, recv_json, send_file, recv_file, set_nodelay, hello
 
 # ==================================================
 #           Helper: Basic TCP Client
@@ -22,6 +22,8 @@ class ServerClient:
     def connect(self):
         self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.conn.connect((self.host, self.port))
+        set_nodelay(self.conn)
+        hello(self.conn)
 
     def send(self, obj: dict):
         send_json(self.conn, obj)
@@ -21,6 +21,8 @@ from tool.common_protocol import (
     send_json, recv_json,
     send_file, recv_file
 )
+# Fixed-rate game loop (monotonic clock, catch-up, tick stats)
+from tool.tick_scheduler import TickScheduler
 
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 10000
@@ -78,4 +80,8 @@ class Game:
 
     def server_start(self):
         # TODO: developer need to call server side function
+        # A real-time game should drive its loop with TickScheduler instead
+        # of time.sleep(), e.g.
+        #     TickScheduler(20).run(update, lambda: not finished)
+        # (or subclass tool.match_host.Match, which ticks the same way)
         pass
@@ -0,0 +1,264 @@
+# codec.py
+"""
+Compact binary encoding for protocol messages.
+
+A msgpack-style tagged format that handles the same values as JSON
+(None, bool, int, float, str, list/tuple, dict) plus bytes. Like JSON,
+map keys are strings: other keys are converted the way json.dumps does,
+so handlers see the same message whichever codec was negotiated. Lists of
+small integers, like Tetris board rows, are packed as one raw int8
+array instead of one tag per element, and decoded back to lists in C.
+"""
+import struct
+from array import array
+
+# -------------------------
+# Tags (big-endian lengths)
+# -------------------------
+# 0x00-0x7f positive fixint     0xe0-0xff negative fixint (-32..-1)
+# 0x80-0x8f fixmap              0x90-0x9f fixarray
+# 0xa0-0xbf fixstr
+NIL, FALSE, TRUE = 0xc0, 0xc2, 0xc3
+INT8_ARRAY = 0xc1               # u16 length + int8 items, decoded as a list
+BIN32 = 0xc6
+FLOAT64 = 0xcb
+INT8, INT16, INT32, INT64 = 0xd0, 0xd1, 0xd2, 0xd3
+STR8, STR16, STR32 = 0xd9, 0xda, 0xdb
+ARRAY16, ARRAY32 = 0xdc, 0xdd
+MAP16, MAP32 = 0xde, 0xdf
+
+MIN_INT8_ARRAY = 4              # shorter int lists are smaller as fixints
+MAX_DEPTH = 64                  # nesting limit of decoded lists / maps
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_I8 = struct.Struct('>b')
+_I16 = struct.Struct('>h')
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+
+
+class CodecError(ValueError):
+    pass
+
+
+# =========================
+# Encode
+# =========================
+def encode(obj) -> bytes:
+    out = bytearray()
+    try:
+        _encode(obj, out)
+    except RecursionError:
+        raise CodecError("Message nested too deeply (circular reference?)")
+    return bytes(out)
+
+def _encode(obj, out):
+    t = type(obj)
+    if t is str:
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out.append(STR8)
+            out.append(n)
+        elif n < 0x10000:
+            out.append(STR16)
+            out += _U16.pack(n)
+        else:
+            out.append(STR32)
+            out += _U32.pack(n)
+        out += data
+    elif t is int:
+        _encode_int(obj, out)
+    elif obj is None:
+        out.append(NIL)
+    elif t is bool:
+        out.append(TRUE if obj else FALSE)
+    elif t is dict:
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out.append(MAP16)
+            out += _U16.pack(n)
+        else:
+            out.append(MAP32)
+            out += _U32.pack(n)
+        for k, v in obj.items():
+            _encode(k if type(k) is str else _key(k), out)
+            _encode(v, out)
+    elif t is list or t is tuple:
+        n = len(obj)
+        if MIN_INT8_ARRAY <= n < 0x10000 and set(map(type, obj)) == {int}:
+            try:
+                packed = array('b', obj).tobytes()
+            except OverflowError:
+                pass
+            else:
+                out.append(INT8_ARRAY)
+                out += _U16.pack(n)
+                out += packed
+                return
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out.append(ARRAY16)
+            out += _U16.pack(n)
+        else:
+            out.append(ARRAY32)
+            out += _U32.pack(n)
+        for v in obj:
+            _encode(v, out)
+    elif t is float:
+        out.append(FLOAT64)
+        out += _F64.pack(obj)
+    elif t is bytes or t is bytearray:
+        out.append(BIN32)
+        out += _U32.pack(len(obj))
+        out += obj
+    else:
+        raise CodecError(f"Cannot encode {t.__name__}")
+
+def _key(k):
+    """Non-str map key as json.dumps writes it."""
+    if k is True:
+        return "true"
+    if k is False:
+        return "false"
+    if k is None:
+        return "null"
+    if isinstance(k, int):
+        return int.__repr__(k)
+    if isinstance(k, float):
+        return float.__repr__(k)
+    if isinstance(k, str):
+        return str(k)
+    raise CodecError(f"Map keys must be str, int, float, bool or None, not {type(k).__name__}")
+
+def _encode_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xff)
+    elif -0x80 <= n < 0x80:
+        out.append(INT8)
+        out += _I8.pack(n)
+    elif -0x8000 <= n < 0x8000:
+        out.append(INT16)
+        out += _I16.pack(n)
+    elif -0x80000000 <= n < 0x80000000:
+        out.append(INT32)
+        out += _I32.pack(n)
+    elif -0x8000000000000000 <= n < 0x8000000000000000:
+        out.append(INT64)
+        out += _I64.pack(n)
+    else:
+        raise CodecError("Integer out of int64 range")
+
+
+# =========================
+# Decode
+# =========================
+def decode(data):
+    buf = memoryview(data)
+    try:
+        obj, pos = _decode(buf, 0, 0)
+    except (IndexError, struct.error) as e:
+        raise CodecError(f"Truncated message: {e}")
+    except UnicodeDecodeError as e:
+        raise CodecError(f"Bad string: {e}")
+    if pos != len(buf):
+        raise CodecError("Trailing bytes after message")
+    return obj
+
+def _decode(buf, pos, depth):
+    tag = buf[pos]
+    pos += 1
+
+    if tag < 0x80:
+        return tag, pos
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if 0xa0 <= tag <= 0xbf:
+        return _str(buf, pos, tag & 0x1f)
+    if 0x90 <= tag <= 0x9f:
+        return _array(buf, pos, tag & 0x0f, depth)
+    if 0x80 <= tag <= 0x8f:
+        return _map(buf, pos, tag & 0x0f, depth)
+
+    if tag == NIL:
+        return None, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == INT8_ARRAY:
+        n = _U16.unpack_from(buf, pos)[0]
+        pos += 2
+        if pos + n > len(buf):
+            raise CodecError("Truncated int8 array")
+        items = array('b')
+        items.frombytes(buf[pos:pos + n])
+        return items.tolist(), pos + n
+    if tag == INT8:
+        return _I8.unpack_from(buf, pos)[0], pos + 1
+    if tag == INT16:
+        return _I16.unpack_from(buf, pos)[0], pos + 2
+    if tag == INT32:
+        return _I32.unpack_from(buf, pos)[0], pos + 4
+    if tag == INT64:
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == FLOAT64:
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    if tag == STR8:
+        return _str(buf, pos + 1, buf[pos])
+    if tag == STR16:
+        return _str(buf, pos + 2, _U16.unpack_from(buf, pos)[0])
+    if tag == STR32:
+        return _str(buf, pos + 4, _U32.unpack_from(buf, pos)[0])
+    if tag == ARRAY16:
+        return _array(buf, pos + 2, _U16.unpack_from(buf, pos)[0], depth)
+    if tag == ARRAY32:
+        return _array(buf, pos + 4, _U32.unpack_from(buf, pos)[0], depth)
+    if tag == MAP16:
+        return _map(buf, pos + 2, _U16.unpack_from(buf, pos)[0], depth)
+    if tag == MAP32:
+        return _map(buf, pos + 4, _U32.unpack_from(buf, pos)[0], depth)
+    if tag == BIN32:
+        n = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        if pos + n > len(buf):
+            raise CodecError("Truncated bytes")
+        return bytes(buf[pos:pos + n]), pos + n
+
+    raise CodecError(f"Unknown tag 0x{tag:02x}")
+
+def _str(buf, pos, n):
+    end = pos + n
+    if end > len(buf):
+        raise CodecError("Truncated string")
+    return str(buf[pos:end], 'utf-8'), end
+
+def _array(buf, pos, n, depth):
+    if depth >= MAX_DEPTH:
+        raise CodecError("Message nested too deeply")
+    items = []
+    for _ in range(n):
+        v, pos = _decode(buf, pos, depth + 1)
+        items.append(v)
+    return items, pos
+
+def _map(buf, pos, n, depth):
+    if depth >= MAX_DEPTH:
+        raise CodecError("Message nested too deeply")
+    obj = {}
+    for _ in range(n):
+        k, pos = _decode(buf, pos, depth + 1)
+        if type(k) is not str:
+            raise CodecError("Map key is not a string")
+        v, pos = _decode(buf, pos, depth + 1)
+        obj[k] = v
+    return obj, pos
@@ -1,8 +1,14 @@
 import os
 import importlib.util
 import sys
+import threading
 
 class GameControl:
+    # A game can be loaded from several folders (games/<name> and the
+    # per-version checkouts of the server's blob store); its modules and
+    # sys.path entries from all of them are replaced on every load.
+    _game_dirs = {}         # game name -> folders the game was loaded from
+    _load_lock = threading.Lock()
 
     def __init__(self, game_name, host='0.0.0.0', port=10000, base_dir="games"):
         self.game_name = game_name
@@ -16,24 +22,31 @@ class GameControl:
             raise FileNotFoundError(f"Game not found: {self.game_path}")
 
         module_name = f"game_{self.game_name}"
-
-        # remove module
         game_dir = os.path.dirname(os.path.abspath(self.game_path))
-        to_delete = []
-        for mod_name, module in list(sys.modules.items()):
-            mod_file = getattr(module, "__file__", None)
-            if mod_file:
-                mod_file = os.path.abspath(mod_file)
-                if mod_file.startswith(game_dir):
+
+        with GameControl._load_lock:
+            dirs = GameControl._game_dirs.setdefault(self.game_name, set())
+            dirs.add(game_dir)
+
+            # remove modules loaded from any folder of this game (other versions too)
+            prefixes = tuple(d + os.sep for d in dirs)
+            to_delete = []
+            for mod_name, module in list(sys.modules.items()):
+                mod_file = getattr(module, "__file__", None)
+                if mod_file and os.path.abspath(mod_file).startswith(prefixes):
                     to_delete.append(mod_name)
 
-        for mod_name in to_delete:
-            del sys.modules[mod_name]
+            for mod_name in to_delete:
+                del sys.modules[mod_name]
+
+            # the game's own imports must resolve in this folder first
+            sys.path[:] = [p for p in sys.path if p not in dirs]
+            sys.path.insert(0, game_dir)
 
-        # load new module
-        spec = importlib.util.spec_from_file_location(module_name, self.game_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+            # load new module
+            spec = importlib.util.spec_from_file_location(module_name, self.game_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
 
         if not hasattr(module, "Game"):
             raise RuntimeError("main.py does not contain class Game")
@@ -0,0 +1,225 @@
+# transfer.py
+"""
+Game downloads over dedicated transfer connections.
+
+The lobby server hands a player a short-lived token for one game folder
+(TransferServer.issue) instead of sending the files over the lobby
+connection. The player (Download) then fetches the files over several
+parallel connections to the transfer port in a background thread, while
+the lobby connection stays free for other requests.
+
+Transfer connection:
+    client -> HELLO (optional), {"token", "files": [...], "offsets": {...}}
+    server -> {"status": "OK"} + FILE_TRANSFER_BEGIN, files, FILE_TRANSFER_END
+"""
+import heapq
+import socket
+import secrets
+import threading
+import time
+from tool.common_protocol import send_json, recv_json, set_nodelay, hello, answer_hello
+from tool.file_manager import FileManager, prepare_staging, install_staging, valid_offsets
+
+TOKEN_TTL = 60              # seconds a token can be used to open connections
+DOWNLOAD_CONNECTIONS = 4    # parallel connections per download
+REQUEST_TIMEOUT = 10        # seconds a connection may take to send its request
+
+
+# ==================================================
+#                  TransferServer
+# ==================================================
+
+class TransferServer:
+    """
+    Serves the files of game folders to holders of a token. A token is
+    valid for TOKEN_TTL seconds and for any number of connections, and
+    only gives access to the files listed in its manifest. versions_of()
+    tells which game versions a live token or a running connection still
+    reads, so their folders are not pruned under them.
+    """
+    def __init__(self, host="0.0.0.0", port=0, ttl=TOKEN_TTL):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.grants = {}        # token -> Grant
+        self.sock = None
+
+    def start(self):
+        """Listen and serve in a background thread. port 0 picks a free port."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        print(f"[TRANSFER] Running at {self.host}:{self.port}")
+
+    def issue(self, folder_path, manifest, name=None, version=None) -> str:
+        """New token for the files of manifest under folder_path (version `version` of game `name`)."""
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self.lock:
+            # drop grants no connection can use any more
+            for old in [t for t, grant in self.grants.items() if not grant.live(now)]:
+                del self.grants[old]
+            self.grants[token] = Grant(folder_path, manifest, now + self.ttl, name, version)
+        return token
+
+    def versions_of(self, name) -> set:
+        """Versions of a game that live tokens or running transfers use."""
+        now = time.monotonic()
+        with self.lock:
+            return {grant.version for grant in self.grants.values()
+                    if grant.name == name and grant.version is not None and grant.live(now)}
+
+    # -------------------------
+    # Internal
+    # -------------------------
+    def _open_grant(self, token):
+        """The grant of token, counted as in use until _close_grant(), or None."""
+        with self.lock:
+            grant = self.grants.get(token)
+            if grant is None or grant.expires < time.monotonic():
+                return None
+            grant.active += 1
+            return grant
+
+    def _close_grant(self, grant):
+        with self.lock:
+            grant.active -= 1
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                return
+            set_nodelay(conn)
+            threading.Thread(target=self._serve, args=(conn, addr), daemon=True).start()
+
+    def _serve(self, conn, addr):
+        grant = None
+        try:
+            # idle connections without a valid request do not keep a thread
+            conn.settimeout(REQUEST_TIMEOUT)
+            req = recv_json(conn)
+            if isinstance(req, dict) and req.get("action") == "HELLO":
+                answer_hello(conn, req)
+                req = recv_json(conn)
+            if isinstance(req, dict):
+                grant = self._open_grant(req.get("token"))
+            if grant is None:
+                send_json(conn, {"status": "FAIL", "msg": "Invalid or expired token"})
+                return
+
+            manifest = grant.manifest
+            files = req.get("files")
+            files = [p for p in files if isinstance(p, str) and p in manifest] if isinstance(files, list) else []
+            offsets = valid_offsets(req.get("offsets"), manifest)
+            send_json(conn, {"status": "OK"})
+            FileManager(conn)._upload_folder(grant.folder_path, files, offsets)
+        except Exception as e:
+            print(f"[TRANSFER] {addr}: {type(e).__name__}: {e}")
+        finally:
+            if grant is not None:
+                self._close_grant(grant)
+            conn.close()
+
+
+class Grant:
+    """What a token gives access to."""
+    __slots__ = ("folder_path", "manifest", "expires", "name", "version", "active")
+
+    def __init__(self, folder_path, manifest, expires, name, version):
+        self.folder_path = folder_path
+        self.manifest = manifest
+        self.expires = expires
+        self.name = name
+        self.version = version
+        self.active = 0         # connections serving files right now
+
+    def live(self, now) -> bool:
+        return self.expires >= now or self.active > 0
+
+
+# ==================================================
+#                  Download
+# ==================================================
+
+class Download(threading.Thread):
+    """
+    Background download of the game of a transfer offer
+        {"port", "token", "name", "manifest"}
+    into base_dir, over up to `connections` parallel connections to host.
+    Files go through the staging folder of file_manager, so a failed
+    download is resumed by the next one and the game only shows up in
+    base_dir once complete. wait() blocks until done and tells whether
+    it succeeded, error holds the reason otherwise.
+    """
+    def __init__(self, host, offer, base_dir, connections=DOWNLOAD_CONNECTIONS):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = offer["port"]
+        self.token = offer["token"]
+        self.name = offer["name"]
+        self.manifest = offer["manifest"]
+        self.base_dir = base_dir
+        self.connections = connections
+        self.error = None
+
+    def wait(self, timeout=None) -> bool:
+        self.join(timeout)
+        return not self.is_alive() and self.error is None
+
+    def run(self):
+        try:
+            staging, need, offsets = prepare_staging(self.base_dir, self.name, self.manifest)
+            groups = _split(need, self.manifest, offsets, self.connections)
+
+            errors = []
+            threads = [threading.Thread(target=self._fetch, args=(staging, files, offsets, errors))
+                       for files in groups]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+
+            install_staging(self.base_dir, self.name)
+            print(f"[Download] {self.name} ready ({len(need)} files over {len(groups)} connections).")
+        except Exception as e:
+            self.error = e
+            print(f"[Download] {self.name} failed: {e}")
+
+    def _fetch(self, staging, files, offsets, errors):
+        try:
+            with socket.create_connection((self.host, self.port)) as conn:
+                set_nodelay(conn)
+                hello(conn)
+                send_json(conn, {
+                    "token": self.token,
+                    "files": files,
+                    "offsets": {p: offsets[p] for p in files if p in offsets},
+                })
+                resp = recv_json(conn)
+                if not resp or resp.get("status") != "OK":
+                    raise ConnectionError((resp or {}).get("msg", "Transfer refused"))
+                FileManager(conn)._receive_folder(staging, self.manifest)
+        except Exception as e:
+            errors.append(e)
+
+
+def _split(need, manifest, offsets, count):
+    """Spread the files over at most count groups of about the same size."""
+    if not need:
+        return []
+    groups = [[] for _ in range(min(count, len(need)))]
+    loads = [(0, i) for i in range(len(groups))]
+    remaining = lambda p: manifest[p]["size"] - offsets.get(p, 0)
+    for rel_path in sorted(need, key=remaining, reverse=True):
+        load, i = heapq.heappop(loads)
+        groups[i].append(rel_path)
+        heapq.heappush(loads, (load + remaining(rel_path), i))
+    return groups
@@ -4,10 +4,12 @@ from server_client import ServerClient
 from tool.file_manager import FileManager, list_games, remove_games
 from tool.game import game_print
 from tool.game_control import GameControl
+from tool.transfer import Download
 from typing import Tuple
 
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 50001
+PAGE_SIZE = 10      # rooms / players shown per page
 
 # ==================================================
 #                   Player Client
@@ -16,6 +18,7 @@ SERVER_PORT = 50001
 class PlayerClient:
     def __init__(self):
         self.client = ServerClient(SERVER_HOST, SERVER_PORT)
+        self.downloads = {}     # game name -> Download running in background
 
     # -------------------------
     # Hard-coded main menu
@@ -65,24 +68,37 @@ class PlayerClient:
                 break
 
     def player_list(self):
-        self.client.send({"select":"list_player"})
-        resp = self.client.recv()
-
-        players = resp.get("players")
-
-        if players == None:
-            print("player_list error: players not in response.")
-
         print("\n=========================")
         print("Online Players:")
         count = 0
-        for player in players:
-            if player[1] == 1 and player[0] != self.client.id:
-                print(f"    {player[0]}: "+ (f"{player[2]}" if player[2] != -1 else f"not in room" ))
-                count += 1
+        after = None
+
+        while True:
+            # server only returns online players, one page at a time
+            self.client.send({"select":"list_player", "online": True, "after": after, "limit": PAGE_SIZE})
+            resp = self.client.recv()
+
+            players = resp.get("players")
+
+            if players == None:
+                print("player_list error: players not in response.")
+                break
+
+            for player in players:
+                if player[0] != self.client.id:
+                    print(f"    {player[0]}: "+ (f"{player[2]}" if player[2] != -1 else f"not in room" ))
+                    count += 1
+
+            after = resp.get("next")
+            if after is None or not self.more_page():
+                break
+
         if count == 0:
             print("    There is no player online.")
         print("=========================")
+
+    def more_page(self) -> bool:
+        return input("Press Enter for next page, q to stop: ").strip().lower() != 'q'
         
     # -------------------------
     # Room Menu
@@ -108,7 +124,7 @@ class PlayerClient:
                     self.game_stage(game)
 
             elif sel == 1: # Enter Room
-                self.list_room()
+                self.list_room(not_full=True)
                 game = self.enter_room(-1)
                 if game:
                     self.game_stage(game)
@@ -143,13 +159,13 @@ class PlayerClient:
         target_game = games[sel]
 
         # Request server version check
-        self.client.send({"req": "check_version", "game": target_game})
+        self.client.send({"req": "check_version", "game": target_game, "parallel": True})
         resp = self.client.recv()
 
         # If server says update required
         if resp["status"] == "Version Error":
             print(resp["msg"])
-            FileManager(self.client.conn, base_dir=base_path).receive_game()
+            self.start_download(base_path)
 
         elif resp["status"] == "Game Remove":
             print(resp["msg"])
@@ -201,35 +217,67 @@ class PlayerClient:
     def check_and_update_game(self, target_game, base_path) -> None:
         """Check local version vs server version & update automatically."""
         
+        self.wait_download(target_game['name'])
         games = list_games(base_path, type=None)
         local = [g for g in games if g['name'] == target_game['name']]
 
-        manager = FileManager(self.client.conn, base_dir=base_path)
-
         if not local:
-            self.client.send({"status":"Game Error"})
+            self.client.send({"status":"Game Error", "parallel": True})
             print(f"[Version] Local copy missing → Downloading...")
-            manager.receive_game()
+            self.start_download(base_path)
         elif local[0]['version'] != target_game['version']:
-            self.client.send({"status":"Game Error"})
+            self.client.send({"status":"Game Error", "parallel": True})
             print(f"[Version] Version mismatch → Updating...")
-            manager.receive_game()
+            self.start_download(base_path)
         else:
             self.client.send({"status":"OK"})
 
-    def list_room(self):
-        self.client.send({"select": 'list_room'})
-        resp = self.client.recv()
+    def start_download(self, base_path) -> None:
+        """Start the download the server offers next, in the background."""
+        offer = self.client.recv()
+        if not offer or offer.get("_type") != "TRANSFER":
+            print("Download Fail. No transfer offer from server.")
+            return
+
+        # one download per game folder at a time
+        self.wait_download(offer["name"])
+        download = Download(self.client.host, offer, base_path)
+        self.downloads[offer["name"]] = download
+        download.start()
+        print(f"[Download] {offer['name']} downloading in background...")
+
+    def wait_download(self, game_name) -> bool:
+        """Wait for the background download of a game, if any. False if it failed."""
+        download = self.downloads.pop(game_name, None)
+        if download is None:
+            return True
+        if download.is_alive():
+            print(f"[Download] Waiting for {game_name} to finish...")
+        return download.wait()
+
+    def list_room(self, not_full=False):
         print('\n===============================')
         print("         Current Rooms           ")
         print('===============================')
-        for room in resp["rooms"]:
-            print(f"Room #{room[0]}:")
-            print(f"    Master: {room[1]}")
-            print(f"    Current Player in room: {room[2]}")
-            print(f"    Game: {room[3]}")
-            print(f"-------------------------------")
-        if len(resp["rooms"]) == 0:
+        count = 0
+        after = None
+
+        while True:
+            self.client.send({"select": 'list_room', "not_full": not_full, "after": after, "limit": PAGE_SIZE})
+            resp = self.client.recv()
+            for room in resp["rooms"]:
+                print(f"Room #{room[0]}:")
+                print(f"    Master: {room[1]}")
+                print(f"    Current Player in room: {room[2]}")
+                print(f"    Game: {room[3]}")
+                print(f"-------------------------------")
+            count += len(resp["rooms"])
+
+            after = resp.get("next")
+            if after is None or not self.more_page():
+                break
+
+        if count == 0:
             print(f"There is no room in server.")
         print('===============================')
     
@@ -281,13 +329,12 @@ class PlayerClient:
             print("Please input game name in above list.")
             return
 
-        self.client.send({"action":"download","game":target_game})
+        self.client.send({"action":"download","game":target_game,"parallel":True})
         resp = self.client.recv()
         
         if resp['status'] == 'OK':
             base_dir = os.path.join("downloads",self.client.id)
-            manager = FileManager(conn = self.client.conn, base_dir=base_dir)
-            manager.receive_game()
+            self.start_download(base_dir)
         else:
             print(f"Download Fail. {resp['msg']}")
 
@@ -318,6 +365,12 @@ class PlayerClient:
         games = list_games(base_dir=path, type=None)
         game_print(games=games)
 
+        for name, download in self.downloads.items():
+            if download.is_alive():
+                print(f"    {name}: downloading...")
+            elif download.error:
+                print(f"    {name}: download failed ({download.error})")
+
     def game_review(self):
         print('=================================')
         print('         Game Reviews            ')
@@ -395,6 +448,9 @@ class PlayerClient:
         port = self.client.recv().get('port')
         print(f"Get game port: {port}")
 
+        if not self.wait_download(game_name):
+            print(f"Download of {game_name} failed, the game may not start.")
+
         path = os.path.join("downloads", self.client.id)
         GameControl(host=SERVER_HOST, port=port, game_name=game_name, base_dir=path).start_player()
     
@@ -415,6 +471,8 @@ class PlayerClient:
 
         # After login: player menu
         self.player_menu()
+        for name in list(self.downloads):
+            self.wait_download(name)
         self.client.close()
 
 # ==================================================
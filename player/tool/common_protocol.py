@@ -3,43 +3,411 @@ import json
 import struct
 import socket
 import select
+import threading
+import zlib
+import os
+import io
+from weakref import WeakKeyDictionary
+from tool import codec
+
+HEADER = struct.Struct('>I')
+FILE_CHUNK = 64 * 1024      # receive buffer size for file bodies
+IOV_MAX = 1024              # max buffers per sendmsg call
+
+# Header bits above the body length
+BINARY_FLAG = 0x80000000    # body is tool.codec, not JSON
+COMPRESS_FLAG = 0x40000000  # body went through the connection's zlib stream
+LENGTH_MASK = 0x3fffffff
+MAX_MESSAGE = 16 * 1024 * 1024  # largest message body accepted, before or after decompression
+
+# Codecs this side can send, in order of preference. Receiving always
+# works for both, the header says which one a frame uses.
+CODECS = ("binary", "json")
+
+# Compression (only sent to peers that accepted it in HELLO)
+COMPRESS_MIN = 512          # smaller messages are sent as is
+COMPRESS_LEVEL = 6          # messages, one zlib stream per connection
+FILE_COMPRESS_LEVEL = 1     # file bodies, favour throughput
+
+
+class Channel:
+    """
+    Protocol state of one connection, created on the first handshake.
+
+    The compressor is one zlib stream flushed (Z_SYNC_FLUSH) after every
+    message, so later messages reuse the history of earlier ones; the
+    peer must decompress every compressed frame in order with its own
+    stream. send_lock keeps compression and the write of a frame together.
+    """
+    def __init__(self):
+        self.codec = "json"
+        self.compress = False
+        self.compressor = None
+        self.decompressor = None
+        self.send_lock = threading.RLock()
+
+    def pack(self, obj: dict) -> list:
+        if self.compress and self.compressor is None:
+            self.compressor = zlib.compressobj(COMPRESS_LEVEL)
+        return pack_message(obj, self.codec, self.compressor if self.compress else None)
+
+    def unpack(self, header: int, body):
+        if header & COMPRESS_FLAG and self.decompressor is None:
+            self.decompressor = zlib.decompressobj()
+        return unpack_message(header, body, self.decompressor)
+
+_channels = WeakKeyDictionary()     # socket -> Channel
+_channels_lock = threading.Lock()
+
+def get_channel(conn: socket.socket, create: bool = True):
+    ch = _channels.get(conn)
+    if ch is None and create:
+        with _channels_lock:
+            ch = _channels.setdefault(conn, Channel())
+    return ch
+
+def set_nodelay(conn: socket.socket):
+    """Disable Nagle so small request/reply messages go out immediately."""
+    try:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass    # not a TCP socket
+
+def send_parts(conn: socket.socket, parts: list):
+    """Write all buffers in parts with as few syscalls as possible."""
+    if not hasattr(conn, "sendmsg"):
+        # no gather write (Windows), send one joined buffer
+        conn.sendall(b"".join(parts))
+        return
+    views = [memoryview(p) for p in parts if len(p)]
+    while views:
+        sent = conn.sendmsg(views[:IOV_MAX])
+        # drop what was fully written, trim the first partially written buffer
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views and sent:
+            views[0] = views[0][sent:]
+
+# -------------------------
+# Codec selection
+# -------------------------
+def set_codec(conn: socket.socket, name: str):
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec: {name}")
+    get_channel(conn).codec = name
+
+def get_codec(conn: socket.socket) -> str:
+    ch = get_channel(conn, create=False)
+    return ch.codec if ch else "json"
+
+def set_compression(conn: socket.socket, enabled: bool):
+    get_channel(conn).compress = enabled
+
+def hello(conn: socket.socket, compress: bool = True) -> str:
+    """Client side of the HELLO handshake: offer our codecs and use the one the peer picks."""
+    send_json(conn, {"action": "HELLO", "codecs": list(CODECS), "compress": compress})
+    resp = recv_json(conn) or {}
+    name = resp.get("codec", "json")
+    set_codec(conn, name)
+    set_compression(conn, bool(resp.get("compress")))
+    return name
+
+def answer_hello(conn: socket.socket, msg: dict) -> str:
+    """Server side of the HELLO handshake: pick our preferred codec the client also offered."""
+    reply = hello_reply(msg)
+    send_json(conn, reply)
+    set_codec(conn, reply["codec"])
+    set_compression(conn, reply["compress"])
+    return reply["codec"]
+
+def hello_reply(msg: dict) -> dict:
+    """The answer to a HELLO. It is sent before the codec and compression it names are switched on."""
+    offered = msg.get("codecs", [])
+    name = next((c for c in CODECS if c in offered), "json")
+    return {"status": "OK", "codec": name, "compress": bool(msg.get("compress"))}
+
+# -------------------------
+# Framing
+# -------------------------
+def pack_message(obj: dict, codec_name: str = "json", compressor=None) -> list:
+    """
+    Encode obj as a frame, returned as [header, body] buffers. With a
+    compressor, bodies of COMPRESS_MIN bytes or more are compressed.
+    """
+    if codec_name == "binary":
+        data = codec.encode(obj)
+        flags = BINARY_FLAG
+    else:
+        data = json.dumps(obj).encode('utf-8')
+        flags = 0
+    if compressor is not None and len(data) >= COMPRESS_MIN:
+        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        flags |= COMPRESS_FLAG
+    return [HEADER.pack(len(data) | flags), data]
+
+def unpack_message(header: int, body, decompressor=None):
+    """
+    Decode the body of a frame whose header word was header. Any bad
+    frame (corrupt, too deeply nested, or inflating past MAX_MESSAGE)
+    raises ValueError.
+    """
+    try:
+        if header & COMPRESS_FLAG:
+            if decompressor is None:
+                raise ValueError("Compressed frame without a decompressor")
+            body = decompressor.decompress(body, MAX_MESSAGE)
+            if decompressor.unconsumed_tail:
+                raise ValueError(f"Message larger than {MAX_MESSAGE} bytes")
+        if header & BINARY_FLAG:
+            return codec.decode(body)
+        return json.loads(body)
+    except (zlib.error, RecursionError) as e:
+        raise ValueError(f"Bad message: {e}")
 
 def send_json(conn: socket.socket, obj: dict):
-    data = json.dumps(obj).encode('utf-8')
-    conn.sendall(struct.pack('>I', len(data)))
-    conn.sendall(data)
+    ch = get_channel(conn, create=False)
+    if ch is None:
+        send_parts(conn, pack_message(obj))
+        return
+    with ch.send_lock:
+        send_parts(conn, ch.pack(obj))
+
+def recv_exact(conn: socket.socket, view: memoryview):
+    """Fill view completely from conn, raise ConnectionError if the peer closes first."""
+    while view:
+        n = conn.recv_into(view)
+        if not n:
+            raise ConnectionError("Connection closed while receiving data")
+        view = view[n:]
 
 def recv_json(conn: socket.socket):
-    hdr = conn.recv(4)
-    if not hdr or len(hdr) < 4:
+    # None only when the peer closed cleanly between messages
+    hdr = bytearray(HEADER.size)
+    n = conn.recv_into(hdr)
+    if not n:
         return None
-    length = struct.unpack('>I', hdr)[0]
-    data = b''
-    while len(data) < length:
-        chunk = conn.recv(length - len(data))
-        if not chunk:
-            raise ConnectionError("Connection closed while receiving JSON")
-        data += chunk
-    return json.loads(data.decode('utf-8'))
+    if n < HEADER.size:
+        recv_exact(conn, memoryview(hdr)[n:])
+    header = HEADER.unpack(hdr)[0]
+    if header & LENGTH_MASK > MAX_MESSAGE:
+        raise ValueError(f"Message larger than {MAX_MESSAGE} bytes")
+
+    data = bytearray(header & LENGTH_MASK)
+    recv_exact(conn, memoryview(data))
+    if header & COMPRESS_FLAG:
+        return get_channel(conn).unpack(header, data)
+    return unpack_message(header, data)
+
+# -------------------------
+# File bodies
+# -------------------------
+# A plain body is `size` raw bytes right after the metadata frame. A
+# compressed body ("compressed": true in the metadata) is a sequence of
+# [4-byte length][zlib data] chunks of at most FILE_CHUNK bytes ended by a
+# zero-length chunk.
+
+def _chunk_parts(data) -> list:
+    """[header, data] parts of data cut into chunks of at most FILE_CHUNK bytes."""
+    view = memoryview(data)
+    parts = []
+    for i in range(0, len(view), FILE_CHUNK):
+        piece = view[i:i + FILE_CHUNK]
+        parts += [HEADER.pack(len(piece)), piece]
+    return parts
+
+def _compressed_chunks(blocks):
+    """Yield [header, data] parts of a compressed chunked body made from the byte blocks."""
+    z = zlib.compressobj(FILE_COMPRESS_LEVEL)
+    for block in blocks:
+        data = z.compress(block)
+        if data:
+            yield _chunk_parts(data)
+    data = z.flush()
+    if data:
+        yield _chunk_parts(data)
+    yield [HEADER.pack(0)]
+
+def recv_to_file(conn: socket.socket, f, size: int, compressed: bool = False):
+    """Copy the body of a size-byte file from conn into the open file f through one reused buffer."""
+    if compressed:
+        _recv_compressed_to_file(conn, f, size)
+        return
+    buf = memoryview(bytearray(min(FILE_CHUNK, size)))
+    received = 0
+    while received < size:
+        n = conn.recv_into(buf[:size - received])
+        if not n:
+            raise ConnectionError("Connection closed during file transfer")
+        f.write(buf[:n])
+        received += n
+
+def recv_chunks(conn: socket.socket):
+    """Yield the chunks of a chunked body as memoryviews, each valid until the next one."""
+    hdr = bytearray(HEADER.size)
+    buf = bytearray(FILE_CHUNK)
+    while True:
+        recv_exact(conn, memoryview(hdr))
+        n = HEADER.unpack(hdr)[0]
+        if n == 0:
+            return
+        if n > FILE_CHUNK:
+            raise ValueError(f"Chunk larger than {FILE_CHUNK} bytes")
+        view = memoryview(buf)[:n]
+        recv_exact(conn, view)
+        yield view
+
+def _recv_compressed_to_file(conn, f, size):
+    z = zlib.decompressobj()
+    written = 0
+    for chunk in recv_chunks(conn):
+        # inflate at most FILE_CHUNK at a time, never past the announced size
+        while chunk:
+            data = z.decompress(chunk, FILE_CHUNK)
+            written += len(data)
+            if written > size:
+                raise ValueError(f"File size mismatch: more than {size} bytes")
+            f.write(data)
+            chunk = z.unconsumed_tail
+    data = z.flush()
+    f.write(data)
+    written += len(data)
+    if written != size:
+        raise ValueError(f"File size mismatch: expected {size}, got {written}")
+
+class ChunkWriter:
+    """
+    Write-only file object that sends what is written to conn as a
+    chunked body, zlib-compressed when compress is set. Data is sent
+    FILE_CHUNK at a time; close() sends the rest and ends the body.
+    """
+    def __init__(self, conn: socket.socket, compress: bool = False):
+        self.conn = conn
+        self.buf = bytearray()
+        self.z = zlib.compressobj(FILE_COMPRESS_LEVEL) if compress else None
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buf += data
+        if len(self.buf) >= FILE_CHUNK:
+            self._emit(final=False)
+        return len(data)
+
+    def _emit(self, final):
+        data = self.buf
+        self.buf = bytearray()
+        if self.z:
+            data = self.z.compress(data)
+            if final:
+                data += self.z.flush()
+        parts = _chunk_parts(data)
+        if final:
+            parts.append(HEADER.pack(0))
+        send_parts(self.conn, parts)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._emit(final=True)
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read-only file object over a chunked body sent by ChunkWriter.
+    Compressed bodies are inflated at most FILE_CHUNK at a time.
+    """
+    def __init__(self, conn: socket.socket, compressed: bool = False):
+        self.chunks = recv_chunks(conn)
+        self.z = zlib.decompressobj() if compressed else None
+        self.pending = memoryview(b"")
+        self.done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.pending:
+            if self.done:
+                return 0
+            if self.z and self.z.unconsumed_tail:
+                data = self.z.decompress(self.z.unconsumed_tail, FILE_CHUNK)
+            else:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    self.done = True
+                    data = self.z.flush() if self.z else b""
+                else:
+                    data = self.z.decompress(chunk, FILE_CHUNK) if self.z else bytes(chunk)
+            self.pending = memoryview(data)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def drain(self):
+        """Consume the rest of the body, up to and including its end marker."""
+        for _ in self.chunks:
+            pass
+        self.done = True
 
 def send_file(conn: socket.socket, filename: str, filebytes: bytes):
     # first send metadata JSON
     meta = {"_type": "file", "filename": filename, "size": len(filebytes)}
-    send_json(conn, meta)
-    # then raw bytes (no length prefix) for the file body
-    conn.sendall(filebytes)
+    ch = get_channel(conn, create=False)
+    if ch is None:
+        # then raw bytes (no length prefix) for the file body, all in one write
+        send_parts(conn, pack_message(meta) + [filebytes])
+        return
+
+    with ch.send_lock:
+        if not ch.compress or len(filebytes) < COMPRESS_MIN:
+            send_parts(conn, ch.pack(meta) + [filebytes])
+            return
+        meta["compressed"] = True
+        send_parts(conn, ch.pack(meta))
+        view = memoryview(filebytes)
+        blocks = (view[i:i + FILE_CHUNK] for i in range(0, len(view), FILE_CHUNK))
+        for parts in _compressed_chunks(blocks):
+            send_parts(conn, parts)
+
+def send_file_path(conn: socket.socket, filename: str, path: str, offset: int = 0):
+    """
+    Like send_file, but streams the body from the file at path so memory
+    use does not grow with the file size. Plain bodies are copied by the
+    kernel with socket.sendfile, compressed ones are read FILE_CHUNK at
+    a time. With an offset only the rest of the file is sent, and the
+    header carries "offset" so the receiver appends it there.
+    """
+    ch = get_channel(conn, create=False)
+    lock = ch.send_lock if ch else threading.RLock()
+
+    with open(path, "rb") as f, lock:
+        size = os.fstat(f.fileno()).st_size - offset
+        if size < 0:
+            raise ValueError(f"Offset {offset} is past the end of {path}")
+        compress = ch is not None and ch.compress and size >= COMPRESS_MIN
+
+        meta = {"_type": "file", "filename": filename, "size": size}
+        if offset:
+            meta["offset"] = offset
+        if compress:
+            meta["compressed"] = True
+        send_parts(conn, ch.pack(meta) if ch else pack_message(meta))
+
+        if not compress:
+            if size and conn.sendfile(f, offset, size) != size:
+                raise ConnectionError(f"{path} changed during transfer")
+            return
+
+        f.seek(offset)
+        blocks = iter(lambda: f.read(FILE_CHUNK), b"")
+        for parts in _compressed_chunks(blocks):
+            send_parts(conn, parts)
 
 def recv_file(conn: socket.socket, dest_path: str):
     meta = recv_json(conn)
     if not meta or meta.get("_type") != "file":
         raise ValueError("Expected file metadata")
     size = meta["size"]
-    received = 0
     with open(dest_path, "wb") as f:
-        while received < size:
-            chunk = conn.recv(min(4096, size - received))
-            if not chunk:
-                raise ConnectionError("Connection closed during file transfer")
-            f.write(chunk)
-            received += len(chunk)
+        recv_to_file(conn, f, size, meta.get("compressed", False))
     return meta["filename"], size
@@ -0,0 +1,104 @@
+# tick_scheduler.py
+"""
+Fixed-timestep ticks for game servers.
+
+A TickScheduler puts tick n at start + n / rate on the time.monotonic()
+clock, so sleep jitter never adds up, wall-clock adjustments do not
+change the game speed, and ticks that came due while the server was busy
+are run back to back (catch-up) instead of being lost. A backlog longer
+than max_catch_up ticks is dropped rather than replayed in one burst.
+Every tick is timed, so overruns show up in stats().
+
+Blocking servers with their own thread call run(tick, running); event
+loops (see match_host) ask due() for the ticks to run and deadline()
+for the next wake-up, and wrap each tick in measure().
+"""
+import time
+
+MAX_CATCH_UP = 5    # ticks run back to back after a stall, the rest is dropped
+
+
+class TickScheduler:
+    def __init__(self, rate, max_catch_up=MAX_CATCH_UP, clock=time.monotonic):
+        self.rate = rate
+        self.step = 1.0 / rate
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.origin = None      # time of tick 0
+        self.next_index = 0     # number of the next tick on the grid
+
+        # stats
+        self.ticks = 0          # ticks run
+        self.dropped = 0        # ticks skipped because of max_catch_up
+        self.overruns = 0       # ticks that took longer than one step
+        self.busy = 0.0         # seconds spent inside ticks
+        self.max_tick = 0.0
+        self.max_late = 0.0     # worst delay between a deadline and its tick
+
+    def start(self, now=None):
+        """Put tick 0 at now (default: the clock's current time)."""
+        self.origin = self.clock() if now is None else now
+        self.next_index = 0
+
+    def deadline(self) -> float:
+        """Clock time at which the next tick is due."""
+        return self.origin + self.next_index * self.step
+
+    def due(self, now=None) -> int:
+        """
+        Number of ticks to run now (0 before the next deadline) and count
+        them as taken. A backlog over max_catch_up keeps only the most
+        recent ticks.
+        """
+        if self.origin is None:
+            self.start(now)
+        now = self.clock() if now is None else now
+        late = now - self.deadline()
+        if late < 0:
+            return 0
+        self.max_late = max(self.max_late, late)
+
+        count = int(late / self.step) + 1
+        if count > self.max_catch_up:
+            self.dropped += count - self.max_catch_up
+            self.next_index += count - self.max_catch_up
+            count = self.max_catch_up
+        self.next_index += count
+        return count
+
+    def measure(self, tick, *args):
+        """Run one tick and record how long it took."""
+        begin = self.clock()
+        try:
+            return tick(*args)
+        finally:
+            spent = self.clock() - begin
+            self.ticks += 1
+            self.busy += spent
+            if spent > self.max_tick:
+                self.max_tick = spent
+            if spent > self.step:
+                self.overruns += 1
+
+    def run(self, tick, running=lambda: True):
+        """Call tick() rate times a second until running() is false."""
+        self.start()
+        while running():
+            delay = self.deadline() - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            for _ in range(self.due()):
+                if not running():
+                    return
+                self.measure(tick)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "dropped": self.dropped,
+            "overruns": self.overruns,
+            "avg_tick_ms": round(self.busy / self.ticks * 1000, 3) if self.ticks else 0.0,
+            "max_tick_ms": round(self.max_tick * 1000, 3),
+            "max_late_ms": round(self.max_late * 1000, 3),
+        }
@@ -0,0 +1,229 @@
+import os
+import json
+import shutil
+import threading
+from tool.file_manager import build_manifest, get_catalog
+
+STORE_DIR = "store"
+
+
+# ==================================================
+#                  BlobStore
+# ==================================================
+
+class BlobStore:
+    """
+    Content-addressed storage of every uploaded game version.
+
+    store/
+        blobs/ab/abcdef...          file contents, named by sha256
+        manifests/<game>/<ver>.json {"name", "version", "config", "files"}
+        checkouts/<ver>/<game>/     a version materialized as hardlinks
+
+    A file shared by several versions or games is stored once. The plain
+    games/<game> folder stays the current version (shop, catalog, new
+    rooms); ingest() turns its files into hardlinks of the blobs. Rooms
+    started on an older version keep running from their checkout, which
+    never changes. Files are hardlinked, so writers must replace a file
+    (unlink, then write) and never rewrite it in place. Game names and
+    versions become path parts, so anything that is not a single plain
+    path component is refused.
+    """
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.manifest_dir = os.path.join(root, "manifests")
+        self.checkout_dir = os.path.join(root, "checkouts")
+        self.lock = threading.RLock()
+        self.manifests = {}     # (name, version) -> manifest, loaded lazily
+
+        for d in (self.blob_dir, self.manifest_dir, self.checkout_dir):
+            os.makedirs(d, exist_ok=True)
+
+    # -------------------------
+    # Query
+    # -------------------------
+    def get(self, name, version):
+        """Stored manifest of a game version, or None."""
+        if not _is_path_part(name) or not _is_path_part(version):
+            return None
+        with self.lock:
+            key = (name, version)
+            if key not in self.manifests:
+                try:
+                    with open(self._manifest_path(name, version), "r", encoding="utf-8") as f:
+                        self.manifests[key] = json.load(f)
+                except (OSError, ValueError):
+                    return None
+            return self.manifests[key]
+
+    def files(self, name, version):
+        """{path: {"size", "sha256", "crc32"}} of a game version, or None."""
+        manifest = self.get(name, version)
+        return manifest["files"] if manifest else None
+
+    def config(self, name, version):
+        """config.json of a game version, or None."""
+        manifest = self.get(name, version)
+        return dict(manifest["config"]) if manifest else None
+
+    def versions(self, name):
+        if not _is_path_part(name):
+            return []
+        folder = os.path.join(self.manifest_dir, name)
+        if not os.path.isdir(folder):
+            return []
+        return [f[:-len(".json")] for f in os.listdir(folder) if f.endswith(".json")]
+
+    # -------------------------
+    # Update
+    # -------------------------
+    def ingest(self, name, base_dir="games"):
+        """
+        Store the current version of a game found in base_dir. Returns the
+        version, or None if the game is not there.
+        """
+        catalog = get_catalog(base_dir)
+        config = catalog.get(name)
+        folder_path = catalog.path(name)
+        if config is None or folder_path is None:
+            return None
+        if not _is_path_part(name) or not _is_path_part(config.get("version")):
+            print(f"[BLOB STORE] Refused {name!r} {config.get('version')!r}: not a valid name / version")
+            return None
+
+        files = catalog.manifest(name)
+        with self.lock:
+            for rel_path, entry in files.items():
+                self._store_blob(os.path.join(folder_path, *rel_path.split("/")), entry["sha256"])
+
+            manifest = {"name": name, "version": config["version"], "config": config, "files": files}
+            path = self._manifest_path(name, config["version"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp, path)
+            self.manifests[(name, config["version"])] = manifest
+
+            # an earlier checkout of the same version number is stale now
+            self._remove_checkout(name, config["version"])
+        return config["version"]
+
+    def sync(self, base_dir="games"):
+        """Ingest every game of base_dir whose current version is not stored yet."""
+        for config in get_catalog(base_dir).list():
+            if self.get(config["name"], config.get("version")) is None:
+                print(f"[BLOB STORE] Ingest {config['name']} {config.get('version')}")
+                self.ingest(config["name"], base_dir)
+
+    def checkout(self, name, version):
+        """
+        Folder holding the files of a game version, built from hardlinks of
+        the blobs on first use. Returns None for unknown versions.
+        """
+        files = self.files(name, version)
+        if files is None:
+            return None     # also for names / versions that are not path parts
+
+        with self.lock:
+            path = os.path.join(self.checkout_dir, version, name)
+            if os.path.isdir(path):
+                return path
+
+            tmp = path + ".tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for rel_path, entry in files.items():
+                dest = os.path.join(tmp, *rel_path.split("/"))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                _link_or_copy(self._blob_path(entry["sha256"]), dest)
+            os.replace(tmp, path)
+            return path
+
+    def prune(self, name, keep):
+        """
+        Drop the versions of a game not listed in keep (with their
+        checkouts), then the blobs no stored version uses any more.
+        """
+        if not _is_path_part(name):
+            return
+        with self.lock:
+            for version in self.versions(name):
+                if version in keep:
+                    continue
+                try:
+                    os.remove(self._manifest_path(name, version))
+                except OSError:
+                    pass
+                self.manifests.pop((name, version), None)
+                self._remove_checkout(name, version)
+            self.collect()
+
+    def collect(self):
+        """Remove blobs that no manifest references."""
+        with self.lock:
+            used = set()
+            for game in os.listdir(self.manifest_dir):
+                for version in self.versions(game):
+                    files = self.files(game, version) or {}
+                    used.update(entry["sha256"] for entry in files.values())
+
+            for prefix in os.listdir(self.blob_dir):
+                folder = os.path.join(self.blob_dir, prefix)
+                for digest in os.listdir(folder):
+                    if digest not in used:
+                        os.remove(os.path.join(folder, digest))
+
+    # -------------------------
+    # Internal
+    # -------------------------
+    def _manifest_path(self, name, version):
+        return os.path.join(self.manifest_dir, name, f"{version}.json")
+
+    def _remove_checkout(self, name, version):
+        """Remove a checkout, and its version folder once no game uses it."""
+        folder = os.path.join(self.checkout_dir, version)
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+        try:
+            os.rmdir(folder)
+        except OSError:
+            pass    # other games still have a checkout of this version
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _store_blob(self, file_path, digest):
+        """Make file_path and the blob of digest one file (hardlinks)."""
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            _link_or_copy(file_path, blob)
+            return
+        if os.path.samefile(blob, file_path):
+            return
+        # same content already stored, share it instead of keeping a copy
+        try:
+            tmp = file_path + ".blob"
+            os.link(blob, tmp)
+            os.replace(tmp, file_path)
+        except OSError:
+            pass
+
+
+# ==========================
+# Helpful Function
+# ==========================
+
+def _is_path_part(value):
+    """True if value can be used as one path component (no separators, no '..')."""
+    return (isinstance(value, str) and value not in ("", ".", "..")
+            and "/" not in value and "\\" not in value and "\0" not in value
+            and not os.path.splitdrive(value)[0])
+
+def _link_or_copy(src, dest):
+    """Hardlink src to dest, copy where links are not supported."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
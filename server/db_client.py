@@ -1,23 +1,111 @@
 import socket
 import threading
-from tool.common_protocol import send_json, recv_json
+import queue
+from tool.common_protocol import send_json, recv_json, set_nodelay
+
+POOL_SIZE = 16      # max idle connections kept open to db_server
 
 # ==================================================
 #        Helper: DB Communication (Client)
 # ==================================================
 class DBClient:
-    def __init__(self, host, port):
+    """
+    Client of db_server with a shared pool of persistent connections.
+
+    A request checks a socket out of the pool, uses it and puts it back, so
+    consecutive requests reuse the same TCP connection instead of paying a
+    handshake (and a TIME_WAIT socket) each time. When a pooled socket turns
+    out broken before any response came back, the idle pool is dropped and
+    the requests are retried once on a new connection.
+    """
+    def __init__(self, host, port, pool_size=POOL_SIZE):
         self.host = host
         self.port = port
+        self.pool = queue.LifoQueue(maxsize=pool_size)
 
-    def send_request(self, req: dict):
-        """Send JSON request to DB server using length-prefixed protocol"""
+    # -------------------------
+    # Connection Pool
+    # -------------------------
+    def _connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect((self.host, self.port))
-            send_json(sock, req)
-            resp = recv_json(sock)
+        except OSError:
             sock.close()
-            return resp
-        except Exception as e:
-            return {"status": "FAIL", "msg": f"DB ERROR: {e}"}
\ No newline at end of file
+            raise
+        set_nodelay(sock)
+        return sock
+
+    def _checkout(self):
+        """Return (socket, reused) - an idle pooled socket or a new one."""
+        try:
+            return self.pool.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _checkin(self, sock):
+        try:
+            self.pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # -------------------------
+    # Requests
+    # -------------------------
+    def send_request(self, req: dict):
+        """Send JSON request to DB server using length-prefixed protocol"""
+        return self.send_pipeline([req])[0]
+
+    def send_pipeline(self, reqs: list):
+        """
+        Send several requests back to back on one connection, then read
+        all responses. db_server answers in order, so responses[i] belongs
+        to reqs[i].
+        """
+        for attempt in range(2):
+            sock, reused = None, False
+            resps = []
+            try:
+                if attempt == 0:
+                    sock, reused = self._checkout()
+                else:
+                    sock = self._connect()
+                for req in reqs:
+                    send_json(sock, req)
+                for _ in reqs:
+                    resp = recv_json(sock)
+                    if resp is None:
+                        raise ConnectionError("DB server closed connection")
+                    resps.append(resp)
+                self._checkin(sock)
+                return resps
+            except Exception as e:
+                if sock:
+                    sock.close()
+                # a pooled socket may have gone stale (db_server restart), and
+                # so have the other idle ones: drop them and retry once on a
+                # new connection. Once a response was read the requests did
+                # reach db_server and are not safe to send again.
+                if attempt == 0 and reused and not resps:
+                    self.close()
+                    continue
+                return resps + [{"status": "FAIL", "msg": f"DB ERROR: {e}"}
+                                for _ in reqs[len(resps):]]
+
+    def send_batch(self, reqs: list):
+        """
+        Run several requests as one BATCH: one round trip and one commit on
+        db_server. Returns the list of responses, or the failure response
+        repeated for every request if the batch was rolled back.
+        """
+        resp = self.send_request({"cmd": "BATCH", "requests": reqs})
+        if resp.get("status") != "OK":
+            return [dict(resp) for _ in reqs]
+        return resp["responses"]
@@ -1,63 +1,196 @@
 import sqlite3
 import socket
 import threading
-from tool.common_protocol import send_json, recv_json
+import queue
+import time
+from contextlib import contextmanager
+from tool.common_protocol import send_json, recv_json, set_nodelay
 
 DB_NAME = "game_system.db"
 HOST = "0.0.0.0"
 PORT = 50000
 
+# SQLite tuning
+BUSY_TIMEOUT = 5.0          # seconds a writer waits for the lock before failing
+SYNCHRONOUS = "NORMAL"      # fsync only at WAL checkpoints, safe with WAL journaling
+
+# Group commit (optional)
+GROUP_COMMIT_MS = 2         # how long the writer waits to collect more mutations
+GROUP_COMMIT_OPS = 64       # max mutations committed together
+GROUP_SYNCHRONOUS = "FULL"  # the writer fsyncs every group, once for all its mutations
+
+# Bulk lookups
+SQL_IN_CHUNK = 500          # max bound parameters per IN (...) query
+
+# Commands that modify the database (routed to the writer in group mode)
+WRITE_COMMANDS = {
+    "REGISTER", "LOGIN", "LOGOUT",
+    "CREATE_ROOM", "UPDATE_ROOM", "PLAYER_EXIT_ROOM", "SET_PORT",
+    "ADD_GAME", "REMOVE_GAME",
+    "ADD_RECORD", "SER_MSG",
+    "BATCH",
+}
+
+# =============================
+#   Schema Migrations
+# =============================
+# (version, statements) applied in order. The applied version is kept in
+# PRAGMA user_version. Never edit a released migration, append a new one.
+MIGRATIONS = [
+    # 1: initial tables
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT NOT NULL,
+            auth TEXT NOT NULL,
+            password TEXT NOT NULL,
+            state INTEGER DEFAULT 0,
+            room INTEGER DEFAULT NULL,
+            PRIMARY KEY (id, auth)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rooms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            master TEXT NOT NULL,
+            players INTEGER DEFAULT 0,
+            game TEXT NOT NULL,
+            port INTEGER DEFAULT -1
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS games (
+            id TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            name TEXT NOT NULL,
+            developer TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS records (
+            player_id TEXT NOT NULL,
+            game TEXT NOT NULL,
+            message TEXT,
+            PRIMARY KEY (player_id, game)
+        )
+        """,
+    ]),
+    # 2: secondary indexes
+    #    users lookups by id alone already use the (id, auth) primary key,
+    #    id is its leftmost column.
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_users_room ON users(room)",
+        "CREATE INDEX IF NOT EXISTS idx_records_game ON records(game)",
+    ]),
+    # 3: room capacity and indexes for filtered / paginated listings
+    (3, [
+        "ALTER TABLE rooms ADD COLUMN capacity INTEGER DEFAULT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_rooms_game ON rooms(game, id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_listing ON users(auth, state, id)",
+    ]),
+]
+
 # =============================
 #   Database Manager Class
 # =============================
 class DatabaseManager:
     def __init__(self, db_name: str):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.cursor = self.conn.cursor()
-        self.init_tables()
+        self.db_name = db_name
+        self._local = threading.local()     # connection, cursor and transaction depth of each thread
+        self.migrate()
 
-    def init_tables(self):
-        """Initialize all required tables"""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT NOT NULL,
-                auth TEXT NOT NULL,
-                password TEXT NOT NULL,
-                state INTEGER DEFAULT 0,
-                room INTEGER DEFAULT NULL,
-                PRIMARY KEY (id, auth)
-            )
-        """)
+    # =============================
+    #   Connection (per thread)
+    # =============================
+    def _open(self):
+        """
+        Open this thread's connection. WAL lets readers run in parallel
+        with the single writer, and busy_timeout makes a second writer wait
+        for the lock instead of failing with 'database is locked'.
+        """
+        conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if getattr(self._local, "conn", None) is None:
+            self._open()
+        return self._local.conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        if getattr(self._local, "cursor", None) is None:
+            self._open()
+        return self._local.cursor
+
+    def close_thread(self):
+        """Close the calling thread's connection (called when its client leaves)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            self._local.cursor = None
 
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rooms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                master TEXT NOT NULL,
-                players INTEGER DEFAULT 0,
-                game TEXT NOT NULL,
-                port INTEGER DEFAULT -1
-            )
-        """)
+    # =============================
+    #   Transaction
+    # =============================
+    @contextmanager
+    def transaction(self):
+        """
+        Run several operations as one transaction.
 
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS games (
-                id TEXT PRIMARY KEY,
-                version TEXT NOT NULL,
-                name TEXT NOT NULL,
-                developer TEXT NOT NULL
-            )
-        """)
+        Inside the block every operation's own commit is deferred and the
+        whole block is committed (or rolled back on error) once. Nested
+        blocks become SAVEPOINTs, so a failing inner block only undoes its
+        own changes.
+        """
+        depth = getattr(self._local, "depth", 0)
+        savepoint = f"sp{depth}"
 
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS records (
-                player_id TEXT NOT NULL,
-                game TEXT NOT NULL,
-                message TEXT,
-                PRIMARY KEY (player_id, game)
-            )
-        """)
+        if depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        else:
+            self.conn.execute(f"SAVEPOINT {savepoint}")
+
+        self._local.depth = depth + 1
+        try:
+            yield
+        except BaseException:
+            if depth == 0:
+                self.conn.rollback()
+            else:
+                self.conn.execute(f"ROLLBACK TO {savepoint}")
+                self.conn.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            if depth == 0:
+                self.conn.commit()
+            else:
+                self.conn.execute(f"RELEASE {savepoint}")
+        finally:
+            self._local.depth = depth
 
-        self.conn.commit()
+    def _commit(self):
+        # commit now unless an enclosing transaction() will do it
+        if getattr(self._local, "depth", 0) == 0:
+            self.conn.commit()
+
+    def migrate(self):
+        """Bring the schema up to the latest version in MIGRATIONS."""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+        for target, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            with self.transaction():
+                for sql in statements:
+                    self.conn.execute(sql)
+                self.conn.execute(f"PRAGMA user_version = {target}")
+            print(f"[DB SERVER] Schema migrated to version {target}")
 
     # =============================
     #   User Operations
@@ -68,7 +201,7 @@ class DatabaseManager:
                 "INSERT INTO users (id, password, auth) VALUES (?, ?, ?)",
                 (uid, password, auth)
             )
-            self.conn.commit()
+            self._commit()
             return {"status": "OK", "msg": "Register success"}
         except sqlite3.IntegrityError:
             return {"status": "FAIL", "msg": "User already exists"}
@@ -101,7 +234,7 @@ class DatabaseManager:
             "UPDATE users SET state = 1 WHERE id = ? AND auth = ?",
             (uid,auth)
         )
-        self.conn.commit()
+        self._commit()
         return {"status": "OK", "msg": "Login success"}
 
     def logout_user(self, uid, auth):
@@ -112,28 +245,76 @@ class DatabaseManager:
             "UPDATE users SET state = 0 WHERE id=? AND auth=?",
             (uid,auth)
         )
-        self.conn.commit()
+        self._commit()
         return {"status": "OK", "msg": "Logout success"}
 
-    def get_players(self):
-        self.cursor.execute("SELECT id, state, room FROM users WHERE auth='player'")
+    def get_players(self, online=False, after=None, limit=None):
+        """
+        List players ordered by id.
+
+        online: only players that are logged in
+        after:  cursor, return players whose id is greater than it
+        limit:  page size, "next" in the reply is the cursor of the next page
+        """
+        query = "SELECT id, state, room FROM users WHERE auth='player'"
+        params = []
+
+        if online:
+            query += " AND state = 1"
+        if after is not None:
+            query += " AND id > ?"
+            params.append(after)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.cursor.execute(query, tuple(params))
         data = self.cursor.fetchall()
-        return {"status":"OK","players":data}
+        return {"status":"OK","players":data, "next": _next_cursor(data, limit)}
 
     # =============================
     #   Room Operations
     # =============================
-    def get_rooms(self):
-        self.cursor.execute("SELECT id, master, players, game, port FROM rooms")
+    def get_rooms(self, game=None, not_full=False, after=None, limit=None):
+        """
+        List rooms ordered by id.
+
+        game:     only rooms of this game
+        not_full: only rooms with a free seat (rooms without capacity count as free)
+        after:    cursor, return rooms whose id is greater than it
+        limit:    page size, "next" in the reply is the cursor of the next page
+        """
+        query = "SELECT id, master, players, game, port, capacity FROM rooms"
+        conditions = []
+        params = []
+
+        if game is not None:
+            conditions.append("game = ?")
+            params.append(game)
+        if not_full:
+            conditions.append("(capacity IS NULL OR players < capacity)")
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.cursor.execute(query, tuple(params))
         data = self.cursor.fetchall()
-        return {"status": "OK", "rooms": data}
+        return {"status": "OK", "rooms": data, "next": _next_cursor(data, limit)}
 
-    def create_room(self, master_id, game, port):
+    def create_room(self, master_id, game, port, capacity=None):
         self.cursor.execute(
-            "INSERT INTO rooms (master, players, game, port) VALUES (?, ?, ?, ?)",
-            (master_id, 0, game, port)
+            "INSERT INTO rooms (master, players, game, port, capacity) VALUES (?, ?, ?, ?, ?)",
+            (master_id, 0, game, port, capacity)
         )
-        self.conn.commit()
+        self._commit()
         room_id = self.cursor.lastrowid
 
         # update user's room
@@ -141,7 +322,7 @@ class DatabaseManager:
             "UPDATE users SET room = ? WHERE id = ?",
             (room_id, master_id)
         )
-        self.conn.commit()
+        self._commit()
         return {"status": "OK", "msg": f"Room #{room_id} created", "room_id": room_id}
 
     def update_room(self, room_id, players, player_id=None):
@@ -156,7 +337,7 @@ class DatabaseManager:
                 (room_id, player_id)
             )
 
-        self.conn.commit()
+        self._commit()
         return {"status": "OK"}
     
     def remove_room(self, room_id):
@@ -178,7 +359,7 @@ class DatabaseManager:
             (room_id,)
         )
 
-        self.conn.commit()
+        self._commit()
 
         return {"status": "OK", "msg": f"Room #{room_id} removed"}
 
@@ -212,7 +393,7 @@ class DatabaseManager:
 
         # If room empty → remove
         if players <= 0:
-            self.conn.commit()
+            self._commit()
             return self.remove_room(room_id)
 
         # Otherwise just update count
@@ -221,7 +402,7 @@ class DatabaseManager:
             (players, room_id)
         )
 
-        self.conn.commit()
+        self._commit()
 
         return {"status": "OK", "msg": f"Player left room #{room_id}"}
 
@@ -231,7 +412,7 @@ class DatabaseManager:
             (port, room_id)
         )
 
-        self.conn.commit()
+        self._commit()
         return {"status":"OK"}
 
     # =============================
@@ -243,7 +424,7 @@ class DatabaseManager:
                 "INSERT INTO games VALUES (?, ?, ?, ?)",
                 (gid, version, name, dev)
             )
-            self.conn.commit()
+            self._commit()
             return {"status": "OK", "msg": "Game added"}
         except sqlite3.IntegrityError:
             return {"status": "FAIL", "msg": "Game already exists"}
@@ -253,7 +434,7 @@ class DatabaseManager:
             "DELETE FROM games WHERE id = ?",
             (gid,)
         )
-        self.conn.commit()
+        self._commit()
         return {"status": "OK", "msg": "Game removed"}
 
     # =============================
@@ -265,7 +446,7 @@ class DatabaseManager:
             INSERT OR IGNORE INTO records (player_id, game, message)
             VALUES (?, ?, NULL)
         """, (id, game))
-        self.conn.commit()
+        self._commit()
         return {"status":"OK"}
 
     def get_record(self, id=None, game=None):
@@ -296,6 +477,32 @@ class DatabaseManager:
 
         return {"status": "OK", "record": record}
 
+    def get_records_for_games(self, games, reviewed=False):
+        """
+        Fetch the records of many games at once.
+
+        Returns {game: [(player_id, game, message), ...]} with an entry
+        (possibly empty) for every requested game. With reviewed=True only
+        records that carry a review message are returned.
+        """
+        games = list(dict.fromkeys(games))
+        records = {g: [] for g in games}
+
+        for i in range(0, len(games), SQL_IN_CHUNK):
+            chunk = games[i:i + SQL_IN_CHUNK]
+            query = f"""
+                SELECT player_id, game, message
+                FROM records
+                WHERE game IN ({",".join("?" * len(chunk))})
+            """
+            if reviewed:
+                query += " AND message IS NOT NULL AND message != ''"
+            self.cursor.execute(query, chunk)
+            for row in self.cursor.fetchall():
+                records[row[1]].append(row)
+
+        return {"status": "OK", "records": records}
+
 
     def set_message(self, id, game, msg):
         self.cursor.execute("""
@@ -304,17 +511,95 @@ class DatabaseManager:
             ON CONFLICT(player_id, game)
             DO UPDATE SET message=excluded.message
         """, (id, game, msg))
-        self.conn.commit()
+        self._commit()
         return {"status":"OK"}
 
+# =============================
+#   Helpful Function
+# =============================
+def _next_cursor(rows, limit):
+    """Cursor of the page after rows: id of the last row, None when this was the last page."""
+    if limit is None or len(rows) < limit:
+        return None
+    return rows[-1][0]
+
+
+# =============================
+#     Group Commit Writer
+# =============================
+class GroupCommitWriter:
+    """
+    Single writer thread that commits queued mutations together.
+
+    Callers block in submit() until the group containing their mutation
+    has been committed, so a response is only sent after it is durable:
+    the writer's connection runs with synchronous=FULL, and the group
+    shares one fsync instead of paying one per mutation.
+    Each mutation runs in its own SAVEPOINT: one failing request is undone
+    alone and does not abort the rest of its group.
+    """
+    def __init__(self, db: DatabaseManager, max_delay_ms=GROUP_COMMIT_MS, max_ops=GROUP_COMMIT_OPS):
+        self.db = db
+        self.max_delay = max_delay_ms / 1000
+        self.max_ops = max_ops
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def in_writer(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def submit(self, func):
+        """Queue func (run on the writer thread) and return its result once committed."""
+        job = {"func": func, "done": threading.Event(), "result": None, "error": None}
+        self.jobs.put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def run(self):
+        self.db.conn.execute(f"PRAGMA synchronous={GROUP_SYNCHRONOUS}")
+        while True:
+            group = [self.jobs.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(group) < self.max_ops:
+                timeout = deadline - time.monotonic()
+                try:
+                    group.append(self.jobs.get(timeout=timeout) if timeout > 0 else self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit_group(group)
+
+    def commit_group(self, group):
+        try:
+            with self.db.transaction():
+                for job in group:
+                    try:
+                        with self.db.transaction():
+                            job["result"] = job["func"]()
+                    except Exception as e:
+                        job["error"] = e
+        except Exception as e:
+            # commit failed, nothing in this group is durable
+            print("[DB SERVER ERROR] group commit failed:", e)
+            for job in group:
+                job["result"] = None
+                job["error"] = job["error"] or e
+
+        for job in group:
+            job["done"].set()
+
+
 # =============================
 #       TCP DB Server
 # =============================
 class DBServer:
-    def __init__(self, host, port, db_name):
+    def __init__(self, host, port, db_name, group_commit=False):
         self.host = host
         self.port = port
         self.db = DatabaseManager(db_name)
+        self.writer = GroupCommitWriter(self.db) if group_commit else None
 
     def handle_client(self, conn, addr):
         print(f"[DB SERVER] Client connected: {addr}")
@@ -332,11 +617,20 @@ class DBServer:
             print("[DB SERVER ERROR]", e)
         finally:
             conn.close()
+            self.db.close_thread()
             print(f"[DB SERVER] Client disconnected: {addr}")
 
     def process_request(self, req):
         cmd = req.get("cmd")
         print(f"[DB Server] Accept request {cmd}")
+
+        # group mode: mutations are executed and committed by the writer thread
+        if self.writer and cmd in WRITE_COMMANDS and not self.writer.in_writer():
+            return self.writer.submit(lambda: self.execute(req))
+        return self.execute(req)
+
+    def execute(self, req):
+        cmd = req.get("cmd")
         match cmd:
             # User
             case "REGISTER":
@@ -351,14 +645,16 @@ class DBServer:
                 return self.db.logout_user(req["id"], req["auth"])
 
             case "GET_PLAYERS":
-                return self.db.get_players()
+                return self.db.get_players(req.get("online", False), req.get("after"), req.get("limit"))
 
             # Rooms
             case "GET_ROOMS":
-                return self.db.get_rooms()
+                return self.db.get_rooms(
+                    req.get("game"), req.get("not_full", False), req.get("after"), req.get("limit")
+                )
 
             case "CREATE_ROOM":
-                return self.db.create_room(req["master"], req["game"], req["port"])
+                return self.db.create_room(req["master"], req["game"], req["port"], req.get("capacity"))
 
             case "UPDATE_ROOM":
                 return self.db.update_room(req["room_id"], req["players"], req.get('player_id'))
@@ -385,21 +681,50 @@ class DBServer:
             case "GET_RECORD":
                 return self.db.get_record(req.get('id'), req.get('game'))
             
+            case "GET_RECORDS_FOR_GAMES":
+                return self.db.get_records_for_games(req.get('games', []), req.get('reviewed', False))
+
             case "SER_MSG":
                 return self.db.set_message(req.get('id'), req.get('game'), req.get('msg'))
 
+            # Batch
+            case "BATCH":
+                return self.process_batch(req.get("requests", []))
+
         return {"status": "FAIL", "msg": "Invalid command"}
 
+    def process_batch(self, requests):
+        """
+        Execute a list of requests in one SQLite transaction and reply with
+        the list of their responses. A request that raises rolls back the
+        whole batch.
+        """
+        if not isinstance(requests, list) or not all(isinstance(r, dict) for r in requests):
+            return {"status": "FAIL", "msg": "BATCH requests must be a list of objects"}
+        if any(r.get("cmd") == "BATCH" for r in requests):
+            return {"status": "FAIL", "msg": "Nested BATCH is not allowed"}
+
+        try:
+            with self.db.transaction():
+                responses = [self.process_request(r) for r in requests]
+        except Exception as e:
+            return {"status": "FAIL", "msg": f"Batch failed: {e}"}
+
+        return {"status": "OK", "responses": responses}
+
     def start(self):
         print(f"[DB SERVER] Starting on {self.host}:{self.port}")
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # lobby keeps pooled connections open, allow rebinding while they sit in TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.bind((self.host, self.port))
         sock.listen()
 
         try:
             while True:
                 conn, addr = sock.accept()
+                set_nodelay(conn)
                 thread = threading.Thread(
                     target=self.handle_client,
                     args=(conn, addr),
@@ -414,12 +739,13 @@ class DBServer:
 
 if __name__ == "__main__":
     from sys import argv
-    if len(argv) != 3:
-        print("Usage: python db_server.py <PORT> <DB_NAME>")
+    if len(argv) not in (3, 4):
+        print("Usage: python db_server.py <PORT> <DB_NAME> [direct|group]")
         exit(1)
 
     PORT = int(argv[1])
     DB_NAME = argv[2]
+    group_commit = len(argv) == 4 and argv[3] == "group"
 
-    server = DBServer(HOST, PORT, DB_NAME)
+    server = DBServer(HOST, PORT, DB_NAME, group_commit=group_commit)
     server.start()
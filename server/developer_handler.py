@@ -1,5 +1,5 @@
 from tool.common_protocol import send_json, recv_json, send_file, recv_file
-from tool.file_manager import FileManager
+from tool.file_manager import FileManager, get_catalog
 import os, json, re
 import running_control as run_games
 
@@ -9,10 +9,14 @@ import running_control as run_games
 # ==========================
 
 class DeveloperHandler:
-    def __init__(self, conn, id, addr):
+    def __init__(self, conn, id, addr, store, rooms, transfers):
         self.conn = conn
         self.user_id = id
         self.addr = addr
+        self.store = store
+        self.rooms = rooms
+        self.transfers = transfers
+        self.pending = None
 
 
     def send(self, msg: dict):
@@ -26,21 +30,33 @@ class DeveloperHandler:
             choice = self.recv()
             if not choice:
                 return
-            sel = choice.get("select")
-            if sel == 'upload_game':
-                self.upload_game()
-            elif sel == 'remove_game':
-                self.remove_game()
-            elif sel == 'list_game':
-                self.list_game()
-            elif sel == 'logout':
+            if not self.menu_step(choice):
                 return
+
+    def menu_step(self, choice) -> bool:
+        """Handle one developer menu message. Returns False on logout."""
+        if self.pending:
+            callback, self.pending = self.pending, None
+            callback(choice)
+            return True
+
+        sel = choice.get("select")
+        # wait for the game the developer picks
+        if sel == 'upload_game':
+            self.pending = self.upload_game
+        elif sel == 'remove_game':
+            self.pending = self.remove_game
+        elif sel == 'list_game':
+            self.list_game()
+        elif sel == 'logout':
+            return False
+        return True
             
-    def upload_game(self):
+    def upload_game(self, msg):
         print(f"{self.addr} : Game upload request")
 
         # version compare
-        game = self.recv().get('game')
+        game = msg.get('game')
         games = self.search_games()
         target_game = [g for g in games if g['name'] == game['name']]
 
@@ -65,13 +81,17 @@ class DeveloperHandler:
         manager = FileManager(self.conn, base_dir='games')
         manager.receive_game()  # receives metadata and files
 
-    def remove_game(self):
+        # keep the new version and the ones open rooms or downloads still use
+        version = self.store.ingest(game['name'])
+        if version is not None:
+            self.store.prune(game['name'], keep={version} | self.in_use(game['name']))
+
+    def remove_game(self, msg):
         print(f"{self.addr}: {self.user_id}, developer remove_game request.")
         dev_id = self.user_id
         game_dir = "games"
 
-        # receive select game
-        msg = self.recv()
+        # selected game
         if not msg or "name" not in msg:
             self.send({"status": "FAIL", "msg": "Invalid remove request"})
             return
@@ -79,25 +99,9 @@ class DeveloperHandler:
         target_name = msg["name"]
 
         # Validate existence + owner + name
-        found_path = None
-        found_config = None
-
-        for game in os.listdir(game_dir):
-            path = os.path.join(game_dir, game)
-            cfg_path = os.path.join(path, "config.json")
-            if not os.path.isfile(cfg_path):
-                continue
-
-            try:
-                with open(cfg_path, "r") as f:
-                    cfg = json.load(f)
-            except:
-                continue
-
-            if cfg.get("name") == target_name and cfg.get("developer") == dev_id:
-                found_path = path
-                found_config = cfg
-                break
+        catalog = get_catalog(game_dir)
+        cfg = catalog.get(target_name)
+        found_path = catalog.path(target_name) if cfg and cfg.get("developer") == dev_id else None
 
         if not found_path:
             self.send({"status": "FAIL", "msg": "Game not found or permission denied"})
@@ -111,12 +115,18 @@ class DeveloperHandler:
         try:
             import shutil
             shutil.rmtree(found_path)
+            catalog.invalidate()
+            self.store.prune(target_name, keep=self.in_use(target_name))
             self.send({"status": "OK", "msg": f"Game '{target_name}' removed successfully"})
 
         except Exception as e:
             self.send({"status": "FAIL", "msg": f"Error removing game: {str(e)}"})
 
         print(f"{self.addr}: {self.user_id}, developer remove_game successfully.")
+
+    def in_use(self, game_name) -> set:
+        """Stored versions of a game that open rooms or downloads still read."""
+        return self.rooms.versions_of(game_name) | self.transfers.versions_of(game_name)
  
     def list_game(self):
         print(f"{self.addr}: {self.user_id} developer list game.")
@@ -124,32 +134,8 @@ class DeveloperHandler:
         self.send({"status": "OK", "games": owned_games})
 
     def search_games(self, mode = 0):
-        game_dir = "games"
-        owned_games = []
-
-        if os.path.isdir(game_dir):
-            for game in os.listdir(game_dir):
-                path = os.path.join(game_dir, game)
-                config_path = os.path.join(path, "config.json")
-                if not os.path.isfile(config_path):
-                    continue
-
-                try:
-                    with open(config_path, "r") as f:
-                        cfg = json.load(f)
-                except:
-                    continue
-
-                if mode:
-                    if cfg['developer'] == self.user_id:
-                        owned_games.append(cfg) 
-                else:
-                    owned_games.append(cfg) 
-                    
-        else:
-            owned_games = []
-
-        return owned_games
+        # mode 1: only games uploaded by this developer
+        return get_catalog("games").list(developer=self.user_id if mode else None)
     
     
 # ==========================
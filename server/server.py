@@ -1,10 +1,19 @@
 import socket
 import threading
+import selectors
+import queue
+import bisect
 import os, json
-from tool.common_protocol import send_json, recv_json
+from concurrent.futures import ThreadPoolExecutor
+from tool.common_protocol import (
+    send_json, recv_json, set_nodelay, answer_hello, get_channel,
+    HEADER, LENGTH_MASK, MAX_MESSAGE
+)
 from db_client import DBClient
-from tool.file_manager import FileManager, list_games
+from tool.file_manager import FileManager, get_catalog
 from developer_handler import DeveloperHandler
+from blob_store import BlobStore
+from tool.transfer import TransferServer
 from tool.game_control import GameControl
 import running_control as run_game
 from typing import Tuple
@@ -13,6 +22,13 @@ DB_HOST = "127.0.0.1"
 DB_PORT = 50000
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 50001
+SERVER_MODE = "thread"      # "thread": one thread per client, "event": selector loop
+TRANSFER_PORT = 0           # game downloads (tool.transfer), 0 picks a free port
+WORKER_THREADS = 32         # worker pool size of event mode
+PERSIST_TIMEOUT = 30        # seconds a caller waits for its queued DB requests
+STEP_TIMEOUT = 10           # seconds a worker waits on a client stalling inside a step
+PAGE_SIZE = 20              # default page size of room / player listings
+MAX_PAGE_SIZE = 100
 
 
 # ==================================================
@@ -30,16 +46,250 @@ def find_free_port():
     s.close()
     return port
 
+def _sorted_discard(ids, value):
+    """Remove value from a sorted list if present."""
+    i = bisect.bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+
+def _islice_from(items, start):
+    """Iterate items from index start without copying the list."""
+    for i in range(start, len(items)):
+        yield items[i]
+
+def _page_size(value):
+    """Page size requested by a client, clamped to MAX_PAGE_SIZE."""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+
+# ==================================================
+#           Room & Presence Registry
+# ==================================================
+class RoomRegistry:
+    """
+    Authoritative in-memory room state of the lobby.
+
+    Rooms are kept in the GET_ROOMS row format [id, master, players, game,
+    port, capacity] so clients see the same data as before. Lookups and
+    listings never touch db_server; changes are written back by a background
+    thread that sends the queued DB requests in order, several at a time as
+    one BATCH.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.rooms = {}         # room_id -> [id, master, players, game, port, capacity]
+        self.order = []         # sorted room ids, for cursor pagination
+        self.by_game = {}       # game name -> sorted list of room_id
+        self.presence = {}      # player_id -> room_id
+        self.versions = {}      # room_id -> game version the room runs
+        self.persist_queue = queue.Queue()
+        threading.Thread(target=self._persist_loop, daemon=True).start()
+        self.load()
+
+    def load(self):
+        """Fill the registry from db_server (rooms left by a previous run)."""
+        rooms = self.db.send_request({"cmd": "GET_ROOMS"}).get("rooms") or []
+        players = self.db.send_request({"cmd": "GET_PLAYERS"}).get("players") or []
+        with self.lock:
+            for room in rooms:
+                self._add(list(room))
+            for player_id, _, room_id in players:
+                if room_id in self.rooms:
+                    self.presence[player_id] = room_id
+
+    # -------------------------
+    # Query
+    # -------------------------
+    def get(self, room_id):
+        with self.lock:
+            room = self.rooms.get(room_id)
+            return list(room) if room else None
+
+    def version(self, room_id):
+        """Game version a room was started with (None for rooms of a previous run)."""
+        with self.lock:
+            return self.versions.get(room_id)
+
+    def versions_of(self, game) -> set:
+        """Versions of a game that open rooms still run."""
+        with self.lock:
+            return {self.versions[r] for r in self.by_game.get(game, []) if r in self.versions}
+
+    def list(self, game=None, not_full=False, after=None, limit=None):
+        """
+        One page of rooms ordered by id, returns (rooms, next_cursor).
+        Only the rooms of the requested game are scanned.
+        """
+        with self.lock:
+            ids = self.by_game.get(game, []) if game is not None else self.order
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+
+            page = []
+            for room_id in _islice_from(ids, start):
+                room = self.rooms[room_id]
+                if not_full and room[5] is not None and room[2] >= room[5]:
+                    continue
+                page.append(list(room))
+                if limit is not None and len(page) == limit:
+                    break
+
+        next_cursor = page[-1][0] if limit is not None and len(page) == limit else None
+        return page, next_cursor
+
+    # -------------------------
+    # Update
+    # -------------------------
+    def create(self, master, game, port, capacity=None, version=None) -> dict:
+        """Create a room. Waits for db_server because it assigns the room id."""
+        with self.lock:
+            waiter = self._persist({
+                "cmd": "CREATE_ROOM",
+                "master": master,
+                "game": game,
+                "port": port,
+                "capacity": capacity
+            }, wait=True)
+        resp = self._wait(waiter)
+
+        if resp.get("status") == "OK":
+            with self.lock:
+                self._add([resp["room_id"], master, 0, game, port, capacity])
+                self.presence[master] = resp["room_id"]
+                if version is not None:
+                    self.versions[resp["room_id"]] = version
+        return resp
+
+    def join(self, room_id, player_id) -> int:
+        """
+        Add a player to a room, return the new player count
+        (-1 if the room is gone, -2 if it is full).
+        """
+        with self.lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                return -1
+            if room[5] is not None and room[2] >= room[5]:
+                return -2
+            room[2] += 1
+            self.presence[player_id] = room_id
+            self._persist({
+                "cmd":"UPDATE_ROOM",
+                "room_id": room_id,
+                "players": room[2],
+                "player_id": player_id
+            })
+            return room[2]
+
+    def leave(self, player_id) -> None:
+        """Remove a player from its room, the room is removed once empty."""
+        with self.lock:
+            room_id = self.presence.pop(player_id, None)
+            room = self.rooms.get(room_id)
+            if room is not None:
+                room[2] -= 1
+                if room[2] <= 0:
+                    self._remove(room_id)
+            self._persist({"cmd": "PLAYER_EXIT_ROOM", "id": player_id})
+
+    def persist(self, *reqs, wait=False):
+        """
+        Queue DB requests behind the pending room updates.
+        With wait=True, return their responses once they were executed.
+        """
+        with self.lock:
+            waiter = self._persist(*reqs, wait=wait)
+        if wait:
+            return self._wait(waiter)
+
+    # -------------------------
+    # Internal (lock held)
+    # -------------------------
+    def _add(self, room):
+        self.rooms[room[0]] = room
+        bisect.insort(self.order, room[0])
+        bisect.insort(self.by_game.setdefault(room[3], []), room[0])
+
+    def _remove(self, room_id):
+        room = self.rooms.pop(room_id)
+        self.versions.pop(room_id, None)
+        _sorted_discard(self.order, room_id)
+        ids = self.by_game.get(room[3])
+        if ids is not None:
+            _sorted_discard(ids, room_id)
+            if not ids:
+                del self.by_game[room[3]]
+
+    def _persist(self, *reqs, wait=False):
+        waiter = {"done": threading.Event(), "resps": None, "count": len(reqs)} if wait else None
+        self.persist_queue.put((list(reqs), waiter))
+        return waiter
+
+    def _wait(self, waiter):
+        if waiter["done"].wait(PERSIST_TIMEOUT):
+            resps = waiter["resps"]
+        else:
+            resps = [{"status": "FAIL", "msg": "DB ERROR: request timed out"}
+                     for _ in range(waiter["count"])]
+        return resps[0] if len(resps) == 1 else resps
+
+    # -------------------------
+    # Write-back Thread
+    # -------------------------
+    def _persist_loop(self):
+        while True:
+            items = [self.persist_queue.get()]
+            while True:
+                try:
+                    items.append(self.persist_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            reqs = [req for item_reqs, _ in items for req in item_reqs]
+            resps = None
+            try:
+                if len(reqs) == 1:
+                    resps = [self.db.send_request(reqs[0])]
+                else:
+                    resps = self.db.send_batch(reqs)
+                for req, resp in zip(reqs, resps):
+                    if resp.get("status") != "OK":
+                        print(f"[ROOM REGISTRY] {req.get('cmd')} failed: {resp.get('msg')}")
+            except Exception as e:
+                # never let one round stop the write-back thread
+                print(f"[ROOM REGISTRY] write-back failed: {e}")
+                resps = [{"status": "FAIL", "msg": f"DB ERROR: {e}"} for _ in reqs]
+            finally:
+                if resps is None or len(resps) != len(reqs):
+                    resps = [{"status": "FAIL", "msg": "DB ERROR: write-back failed"} for _ in reqs]
+                i = 0
+                for item_reqs, waiter in items:
+                    if waiter is not None:
+                        waiter["resps"] = resps[i:i + len(item_reqs)]
+                        waiter["done"].set()
+                    i += len(item_reqs)
+
 # ==================================================
 #           Player & Developer Connection
 # ==================================================
 class ClientHandler:
-    def __init__(self, conn, addr, db_client):
+    def __init__(self, conn, addr, db_client, rooms, store, transfers):
         self.conn = conn
         self.addr = addr
         self.db = db_client
+        self.rooms = rooms
+        self.store = store
+        self.transfers = transfers
         self.user_id = None
         self.auth = None
+        self.game_name = None
+        self.game_version = None
+        self.game_thread = None
+        self.room_port = -1
+        self.developer_handler = None
+        self.pending = None
         print(f"[SERVER] Client connected: {addr}")
 
     # -------------------------
@@ -57,26 +307,34 @@ class ClientHandler:
     # -------------------------
 
     def login_menu(self):
-        while True:
+        while self.user_id is None:
             choice = self.recv()
             if not choice:
                 return False
 
-            sel = choice["action"]
-            if sel == 'LOGIN_REQUEST':
-                result = self.handle_login()
-                if result:
-                    break
-            elif sel == 'REGISTER_REQUEST':
-                result = self.handle_register()
-            else:
-                result = False
+            self.login_step(choice)
+
+    def login_step(self, choice) -> None:
+        """Handle one login/register message."""
+        if self.pending:
+            self.resume(choice)
+            return
+
+        sel = choice["action"]
+        if sel == 'HELLO':
+            codec = answer_hello(self.conn, choice)
+            print(f"[{self.addr}] using {codec} codec")
+        elif sel == 'LOGIN_REQUEST':
+            self.handle_login()
+        elif sel == 'REGISTER_REQUEST':
+            self.handle_register()
 
     def handle_login(self):
         print(f"[{self.addr}] login request")
         self.send({"request": "LOGIN_INFO"})
-        info = self.recv()
+        self.pending = self.finish_login
 
+    def finish_login(self, info):
         resp = self.db.send_request({
             "cmd": "LOGIN",
             "id": info["id"],
@@ -93,7 +351,9 @@ class ClientHandler:
     def handle_register(self):
         print(f"[{self.addr}] register request")
         self.send({"request": "REGISTER_INFO"})
-        info = self.recv()
+        self.pending = self.finish_register
+
+    def finish_register(self, info):
         resp = self.db.send_request({
             "cmd": "REGISTER",
             "id": info["id"],
@@ -103,6 +363,19 @@ class ClientHandler:
         self.send(resp)
         return resp["status"] == "OK"
 
+    # -------------------------
+    # Pending Reply
+    # -------------------------
+
+    # Whenever the next message depends on the user typing something,
+    # the handler stores the function that continues the flow in
+    # self.pending instead of blocking in recv(). Both the threaded
+    # menus and EventServer feed the next message through resume().
+
+    def resume(self, msg):
+        callback, self.pending = self.pending, None
+        callback(msg)
+
     # -------------------------
     # Main Menu
     # -------------------------
@@ -111,88 +384,132 @@ class ClientHandler:
         if self.auth == "player":
             self.player_menu()
         elif self.auth == "developer":
-            DeveloperHandler(self.conn, self.user_id, self.addr).menu()
+            self.developer().menu()
         self.logout()
 
+    def developer(self):
+        if self.developer_handler is None:
+            self.developer_handler = DeveloperHandler(self.conn, self.user_id, self.addr, self.store, self.rooms, self.transfers)
+        return self.developer_handler
+
+    def step(self, choice) -> bool:
+        """
+        Serve exactly one message of this session (used by EventServer,
+        which reads the message itself).
+
+        Returns:
+            True  - session is alive, wait for the next message
+            False - client logged out or disconnected
+        """
+        if not choice:
+            return False
+
+        if self.user_id is None:
+            self.login_step(choice)
+            if self.user_id is not None:
+                print(f"{self.addr} : Login success as {self.auth}")
+            return True
+
+        if self.auth == "player":
+            alive = self.player_step(choice)
+        else:
+            alive = self.developer().menu_step(choice)
+
+        if not alive:
+            self.logout()
+        return alive
+
     # -------------------------
     # Player Menu
     # -------------------------
     
     def player_menu(self):
-        game_name = None
-
         while True:
             choice = self.recv()
             if not choice:
                 return
 
-            sel = choice["select"]
-            if sel == 'create_room':
-                print(f"[{self.addr}]: {self.user_id} create room request.")
-                game_name, port = self.create_room()
-                if game_name is not None:
-                    print(f"Get game port: {port}")
-                    controller = GameControl(host="0.0.0.0", port=port, game_name=game_name)
-                    self.game_thread = threading.Thread(
-                    target=controller.start_server,
-                        daemon=True
-                    )
-                    self.game_thread.start()
-
-            elif sel == 'enter_room':
-                print(f"[{self.addr}]: {self.user_id} enter room request.")
-                game_name, port = self.enter_room()
-                if game_name != None:
-                    resp = self.recv()
-                    if resp['room_action'] == 0:
-                        run_game.set_running_game(game_name)
-                        self.send({'port':port})
-                    else:
-                        self.db.send_request({"cmd": "PLAYER_EXIT_ROOM", "id": self.user_id})
+            if not self.player_step(choice):
+                return
 
-            elif sel == 'list_room':        
-                print(f"[{self.addr}]: {self.user_id} check room request.")
-                self.check_rooms()
+    def player_step(self, choice) -> bool:
+        """Handle one player menu message. Returns False on logout."""
+        if self.pending:
+            self.resume(choice)
+            return True
 
-            elif sel == 'logout':        
-                print(f"[{self.addr}]: {self.user_id} logout request.")
-                return
+        sel = choice["select"]
+        if sel == 'create_room':
+            print(f"[{self.addr}]: {self.user_id} create room request.")
+            self.pending = self.start_room
 
-            elif sel == 'game_shop':
-                print(f"[{self.addr}]: {self.user_id} game shop request.")
-                self.game_shop()
-            
-            elif sel == 'list_player':
-                print(f"[{self.addr}]: {self.user_id} player list request.")
-                self.send(self.db.send_request({"cmd":"GET_PLAYERS"}))
-            
-            elif sel == 'end_game':
-                try:
-                    if self.game_thread:
-                        self.game_thread.join(timeout=2)
-                        print("Game thread terminated.")
-                except:
-                    print("Game thread has been closed.")
-                run_game.remove_running_game(game_name)
+        elif sel == 'enter_room':
+            print(f"[{self.addr}]: {self.user_id} enter room request.")
+            self.pending = self.enter_room
 
-                resp = self.db.send_request({"cmd": "PLAYER_EXIT_ROOM", "id": self.user_id})
+        elif sel == 'list_room':        
+            print(f"[{self.addr}]: {self.user_id} check room request.")
+            self.check_rooms(choice)
 
-                if resp['status'] != 'OK':
-                    print(f"[ERROR MESSAGE] end game {resp.get('msg')}")
+        elif sel == 'logout':        
+            print(f"[{self.addr}]: {self.user_id} logout request.")
+            return False
 
-                self.db.send_request({
-                    "cmd": "ADD_RECORD",
-                    "id": self.user_id,
-                    "game": game_name
-                })
+        elif sel == 'game_shop':
+            print(f"[{self.addr}]: {self.user_id} game shop request.")
+            self.game_shop()
+        
+        elif sel == 'list_player':
+            print(f"[{self.addr}]: {self.user_id} player list request.")
+            self.send(self.db.send_request({
+                "cmd":"GET_PLAYERS",
+                "online": choice.get("online", False),
+                "after": choice.get("after"),
+                "limit": _page_size(choice.get("limit"))
+            }))
+        
+        elif sel == 'end_game':
+            try:
+                if self.game_thread:
+                    self.game_thread.join(timeout=2)
+                    print("Game thread terminated.")
+            except:
+                print("Game thread has been closed.")
+            run_game.remove_running_game(self.game_name)
+
+            self.rooms.leave(self.user_id)
+            self.rooms.persist({"cmd": "ADD_RECORD", "id": self.user_id, "game": self.game_name})
+
+        return True
+
+    def start_room(self, req):
+        self.game_name, port = self.create_room(req)
+        if self.game_name is not None:
+            print(f"Get game port: {port}")
+            # run from the version's checkout, later uploads don't touch it
+            checkout = self.store.checkout(self.game_name, self.game_version)
+            base_dir = os.path.dirname(checkout) if checkout else "games"
+            controller = GameControl(host="0.0.0.0", port=port, game_name=self.game_name, base_dir=base_dir)
+            self.game_thread = threading.Thread(
+            target=controller.start_server,
+                daemon=True
+            )
+            self.game_thread.start()
+
+    def room_action(self, resp):
+        if resp['room_action'] == 0:
+            run_game.set_running_game(self.game_name)
+            self.send({'port':self.room_port})
+        else:
+            self.rooms.leave(self.user_id)
 
     # -------------------------
     # Room Management
     # -------------------------
 
     # return game_name, port
-    def create_room(self) -> Tuple[str, int] :
-        target_game = self.recv().get("game")
+    def create_room(self, req) -> Tuple[str, int] :
+        target_game = req.get("game")
 
         if target_game == None:
             self.send({"status":"Fail", "msg":"Invalid game data"})
@@ -206,106 +523,129 @@ class ClientHandler:
 
         if game_cfg['version'] != target_game['version']:
             self.send({"status":"Version Error", "msg":"Updating game..."})
-            self.update_version(target_game['name'], "games")
+            self.update_version(target_game['name'], parallel=req.get("parallel", False))
         else:
             self.send({"status":"OK"})
 
         # finally create room
         port = find_free_port()
 
-        resp = self.db.send_request({
-            "cmd": "CREATE_ROOM",
-            "master": self.user_id,
-            "game": target_game['name'],
-            "port": port
-        })
+        self.game_version = game_cfg['version']
+        resp = self.rooms.create(self.user_id, target_game['name'], port, game_cfg.get('players'), self.game_version)
         self.send(resp)
 
         return target_game['name'], port
 
-    # return game_name, port
-    def enter_room(self) -> Tuple[str, int]:
-        room_id = self.recv().get("room")
+    def enter_room(self, req) -> None:
+        """
+        Send the game config of the requested room. The client checks its
+        copy of the game (maybe downloading it) and answers as the next
+        message, handled by finish_enter().
+        """
+        room_id = req.get("room")
 
         # exit room
         if room_id == None:
-            return None, -1
+            return
 
         # get room info
-        rooms = self.db.send_request({"cmd": "GET_ROOMS"})["rooms"]
-        match = [r for r in rooms if r[0] == room_id]
+        room = self.rooms.get(room_id)
 
-        if not match:
+        if not room:
             self.send({"status": "Fail", "msg": "Room not found"})
-            return None, -1
+            return
 
-        room = match[0]
         game_name = room[3]
 
-        game_cfg = self.get_game_config(game_name)
+        # the room may still run an older version than the shop has
+        version = self.rooms.version(room_id)
+        game_cfg = (version and self.store.config(game_name, version)) or self.get_game_config(game_name)
         if not game_cfg:
             self.send({"status":"Fail", "msg":"Game removed from server"})
-            return None, -1
-        elif room[2] == game_cfg.get('players'):
-            self.send({"status":"Fail", "msg":"Room is full. Please choose others room."})
-            return None, -1
+            return
 
-        # send server game info to client
+        # send server game info to client, then wait for its version check
         self.send({"status":"OK", "game":game_cfg})
+        self.pending = lambda resp: self.finish_enter(resp, room_id, game_name, room[4], version)
 
-        # wait for client to check its version
-        resp = self.recv()
+    def finish_enter(self, resp, room_id, game_name, port, version) -> None:
         if resp["status"] == "Game Error":  
-            self.update_version(game_name, "games")
-
-        # update room player count
-        updated = room[2] + 1
-        self.db.send_request({
-            "cmd":"UPDATE_ROOM",
-            "room_id": room_id,
-            "players": updated,
-            "player_id": self.user_id
-        })
+            self.update_version(game_name, version, resp.get("parallel", False))
 
-        self.send({"status":"OK", "msg":f"Entered room #{room_id}"})
-        return game_name, room[4]
+        # update room player count, the capacity is checked under the registry lock
+        players = self.rooms.join(room_id, self.user_id)
+        if players == -2:
+            self.send({"status":"Fail", "msg":"Room is full. Please choose others room."})
+            return
+        if players < 0:
+            self.send({"status": "Fail", "msg": "Room not found"})
+            return
 
-    def check_rooms(self) -> None:
-        resp = self.db.send_request({"cmd": "GET_ROOMS"})
-        self.send(resp)
+        self.send({"status":"OK", "msg":f"Entered room #{room_id}"})
+        self.game_name, self.room_port = game_name, port
+        self.pending = self.room_action
+
+    def check_rooms(self, req) -> None:
+        rooms, next_cursor = self.rooms.list(
+            game=req.get("game"),
+            not_full=req.get("not_full", False),
+            after=req.get("after"),
+            limit=_page_size(req.get("limit"))
+        )
+        self.send({"status": "OK", "rooms": rooms, "next": next_cursor})
+
+    def update_version(self, target_game_name, version=None, parallel=False) -> None:
+        """
+        Send a game to the client: the current version, or a stored older
+        one. Clients asking for parallel downloads get a transfer offer
+        instead and fetch the files themselves.
+        """
+        current = self.get_game_config(target_game_name)
+        if parallel:
+            self.send(self.transfer_offer(target_game_name, version or (current and current['version'])))
+            return
+        if version and current and version != current['version']:
+            checkout = self.store.checkout(target_game_name, version)
+            if checkout:
+                # stored versions never change, their manifest needs no hashing
+                manager = FileManager(self.conn, base_dir=os.path.dirname(checkout))
+                manager.upload_game(target_game_name, manifest=self.store.files(target_game_name, version))
+                return
+        FileManager(self.conn, base_dir="games").upload_game(target_game_name)
 
-    def update_version(self, target_game_name, base_dir) -> None:
-        FileManager(self.conn, base_dir=base_dir).upload_game(target_game_name)
+    def transfer_offer(self, game_name, version) -> dict:
+        """
+        Token for downloading a game version from the transfer server.
+        Files are served from the version's checkout, which never changes
+        and is kept by prune() while the token or its transfers are live.
+        """
+        folder_path = self.store.checkout(game_name, version) if version else None
+        if folder_path:
+            manifest = self.store.files(game_name, version)
+        else:
+            catalog = get_catalog("games")
+            folder_path, manifest = catalog.path(game_name), catalog.manifest(game_name)
+
+        return {
+            "_type": "TRANSFER",
+            "port": self.transfers.port,
+            "token": self.transfers.issue(folder_path, manifest, game_name, version),
+            "name": game_name,
+            "version": version,
+            "manifest": manifest,
+        }
 
     def get_game_config(self, game_name, game_dir="games") -> dict:
         """
-        Search the server's game directory for a game with the given name
-        and return its config.json contents as a dict.
+        Look up a game by name in the catalog of the server's game
+        directory and return its config.json contents as a dict.
 
         Returns:
             dict  - if game exists
             None  - if not found or config invalid
         """
 
-        for folder in os.listdir(game_dir):
-            game_path = os.path.join(game_dir, folder)
-            config_path = os.path.join(game_path, "config.json")
-
-            if not os.path.isfile(config_path):
-                continue
-
-            try:
-                with open(config_path, "r") as f:
-                    cfg = json.load(f)
-            except:
-                continue
-
-            # match by config name
-            if cfg.get("name") == game_name:
-                return cfg
-
-        # not found
-        return None
+        return get_catalog(game_dir).get(game_name)
         
     # -------------------------
     # Logout
@@ -313,8 +653,8 @@ class ClientHandler:
 
     def logout(self):
         print(f"[{self.addr}] {self.user_id} Logout Request")
-        self.db.send_request({"cmd": "PLAYER_EXIT_ROOM", "id": self.user_id})
-        resp = self.db.send_request({"cmd": "LOGOUT", "id": self.user_id, "auth":self.auth})
+        self.rooms.leave(self.user_id)
+        resp = self.rooms.persist({"cmd": "LOGOUT", "id": self.user_id, "auth":self.auth}, wait=True)
         self.send(resp)
 
     # -------------------------
@@ -328,45 +668,43 @@ class ClientHandler:
         game_review = []
 
         if os.path.isdir(game_dir):
-            for game in os.listdir(game_dir):
-                path = os.path.join(game_dir, game)
-                config_path = os.path.join(path, "config.json")
-                if not os.path.isfile(config_path):
-                    continue
-
-                try:
-                    with open(config_path, "r") as f:
-                        cfg = json.load(f)
-                except:
-                    continue
-
-                owned_games.append(cfg)
-                review = self.db.send_request({'cmd':'GET_RECORD','game':cfg['name']})
-                game_review.append(review.get('record'))
+            owned_games = get_catalog(game_dir).list()
+
+            # reviews of every game in one query
+            resp = self.db.send_request({'cmd':'GET_RECORDS_FOR_GAMES',
+                                         'games':[g['name'] for g in owned_games],
+                                         'reviewed':True})
+            records = resp.get('records', {})
+            game_review = [records.get(g['name'], []) for g in owned_games]
         else:
             owned_games = []
 
         self.send({'status':'OK', 'games':owned_games, 'reviews':game_review})
 
-        while True:
-            # Download and Exit
-            resp = self.recv()
-            print(resp)
-            if resp['action'] == 'download':
-                print(f"[{self.addr}]: {self.user_id} game download request")
-                self.player_download(resp['game'])
-            if resp['action'] == 'review':
-                print(f"[{self.addr}]: {self.user_id} game review request")
-                self.game_review()
-            elif resp['action'] == 'exit':
-                print(f"[{self.addr}]: {self.user_id} game shop exit.")
-                return
-
-    def player_download(self, target_game):
-
-        games = list_games("games")
-        if target_game in games:
+        self.pending = self.shop_step
+
+    def shop_step(self, resp):
+        # Download and Exit
+        print(resp)
+        self.pending = self.shop_step
+        if resp['action'] == 'download':
+            print(f"[{self.addr}]: {self.user_id} game download request")
+            self.player_download(resp['game'], resp.get('parallel', False))
+        if resp['action'] == 'review':
+            print(f"[{self.addr}]: {self.user_id} game review request")
+            self.game_review()
+        elif resp['action'] == 'exit':
+            print(f"[{self.addr}]: {self.user_id} game shop exit.")
+            self.pending = None
+
+    def player_download(self, target_game, parallel=False):
+
+        game_cfg = get_catalog("games").get(target_game)
+        if game_cfg:
             self.send({"status":"OK"})
+            if parallel:
+                self.send(self.transfer_offer(target_game, game_cfg['version']))
+                return
             manager = FileManager(conn=self.conn, base_dir="games")
             manager.upload_game(target_game)
         else:
@@ -383,9 +721,12 @@ class ClientHandler:
         if len(resp['record']) == 0:
             return
 
-        # Receive updated review request
-        req = self.recv()
-        
+        # Wait for updated review request
+        self.pending = self.set_review
+
+    def set_review(self, req):
+        self.pending = self.shop_step
+
         if req.get('action') != 'set_review':
             self.send({"status": "ERROR", "msg": "Invalid action"})
             return
@@ -410,9 +751,14 @@ class Server:
         self.host = host
         self.port = port
         self.db = DBClient(DB_HOST, DB_PORT)
+        self.rooms = RoomRegistry(self.db)
+        self.store = BlobStore()
+        self.store.sync("games")
+        self.transfers = TransferServer(host, TRANSFER_PORT)
 
     def start(self):
         print(f"[SERVER] Running at {self.host}:{self.port}")
+        self.transfers.start()
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.bind((self.host, self.port))
         sock.listen()
@@ -420,6 +766,7 @@ class Server:
         try:
             while True:
                 conn, addr = sock.accept()
+                set_nodelay(conn)
                 thread = threading.Thread(target=self.client_thread, args=(conn, addr), daemon=True)
                 thread.start()
         except KeyboardInterrupt:
@@ -428,7 +775,7 @@ class Server:
             sock.close()
 
     def client_thread(self, conn, addr):
-        handler = ClientHandler(conn, addr, self.db)
+        handler = ClientHandler(conn, addr, self.db, self.rooms, self.store, self.transfers)
 
         # action
         try:
@@ -442,13 +789,171 @@ class Server:
 
         print(f"[SERVER] Client disconnected: {addr}")
 
+
+class EventServer(Server):
+    """
+    Lobby server driven by one selector loop.
+
+    Idle sessions are only a socket registered in the selector plus their
+    ClientHandler. The loop reads each message until it is complete, then
+    the session is unregistered and handed to a small worker pool, which
+    runs ClientHandler.step() and then parks the session in the selector
+    again. Thread count stays at WORKER_THREADS no matter how many players
+    are logged in, and a client sending half a message holds no worker.
+    """
+    def __init__(self, host, port, workers=WORKER_THREADS):
+        super().__init__(host, port)
+        self.workers = workers
+        self.selector = selectors.DefaultSelector()
+        self.ready = queue.SimpleQueue()
+        self.inbufs = {}        # ClientHandler -> bytes of its next message read so far
+        self.pool = None
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+
+    def start(self):
+        print(f"[SERVER] Running at {self.host}:{self.port} (event mode, {self.workers} workers)")
+        self.transfers.start()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host, self.port))
+        sock.listen()
+        sock.setblocking(False)
+
+        self.selector.register(sock, selectors.EVENT_READ, "accept")
+        self.selector.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.pool = pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        try:
+            while True:
+                for key, _ in self.selector.select():
+                    if key.data == "accept":
+                        self.accept(sock)
+                    elif key.data == "wake":
+                        self.resume_sessions()
+                    else:
+                        self.read_session(key.data)
+        except KeyboardInterrupt:
+            print("\n[SERVER] Shutting down...")
+        finally:
+            pool.shutdown(wait=False)
+            self.selector.close()
+            sock.close()
+
+    def accept(self, sock):
+        try:
+            conn, addr = sock.accept()
+        except BlockingIOError:
+            return
+        # handlers use blocking send/recv inside a step
+        conn.setblocking(True)
+        set_nodelay(conn)
+        handler = ClientHandler(conn, addr, self.db, self.rooms, self.store, self.transfers)
+        self.inbufs[handler] = bytearray()
+        self.selector.register(conn, selectors.EVENT_READ, handler)
+
+    def read_session(self, handler):
+        """
+        Loop: read what is readable of the session's next message, never
+        past its end (steps may read more from the socket themselves).
+        A complete message goes to a worker.
+        """
+        buf = self.inbufs[handler]
+        want = HEADER.size
+        if len(buf) >= HEADER.size:
+            want += HEADER.unpack_from(buf)[0] & LENGTH_MASK
+        try:
+            data = handler.conn.recv(want - len(buf))
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(handler.conn)
+            self.close_session(handler)
+            return
+
+        buf += data
+        if len(buf) < HEADER.size:
+            return
+        header = HEADER.unpack_from(buf)[0]
+        if header & LENGTH_MASK > MAX_MESSAGE:
+            print(f"[SERVER] {handler.addr}: message too large")
+            self.selector.unregister(handler.conn)
+            self.close_session(handler)
+            return
+        if len(buf) < HEADER.size + (header & LENGTH_MASK):
+            return
+
+        body = bytes(buf[HEADER.size:])
+        buf.clear()
+        # session busy: stop watching it until the step is done
+        self.selector.unregister(handler.conn)
+        self.pool.submit(self.serve_step, handler, header, body)
+
+    def serve_step(self, handler, header, body):
+        """
+        Worker: serve one message, then give the session back to the loop.
+        A client that stalls for STEP_TIMEOUT while the step still reads
+        from it (file uploads) is closed.
+        """
+        try:
+            msg = get_channel(handler.conn).unpack(header, body)
+            handler.conn.settimeout(STEP_TIMEOUT)
+            alive = handler.step(msg)
+            handler.conn.settimeout(None)
+        except Exception as e:
+            print(f"[DEBUG MESSAGE] {e}")
+            alive = False
+
+        if not alive:
+            self.close_session(handler)
+            return
+
+        self.ready.put(handler)
+        try:
+            self.wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # loop already has pending wake-ups
+
+    def resume_sessions(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                handler = self.ready.get_nowait()
+            except queue.Empty:
+                return
+            self.selector.register(handler.conn, selectors.EVENT_READ, handler)
+
+    def close_session(self, handler):
+        self.inbufs.pop(handler, None)
+        # a disconnect skips handler.logout(): leave the room like it does,
+        # queued behind the pending room updates
+        if handler.user_id is not None:
+            self.rooms.leave(handler.user_id)
+        self.rooms.persist({"cmd": "LOGOUT", "id": handler.user_id, "auth":handler.auth})
+        try:
+            handler.conn.close()
+        except OSError:
+            pass
+        print(f"[SERVER] Client disconnected: {handler.addr}")
+
 if __name__ == "__main__":
     from sys import argv
-    if len(argv) != 3:
-        print("Usage: python server.py <DB_PORT> <SERVER_PORT>")
+    if len(argv) not in (3, 4):
+        print("Usage: python server.py <DB_PORT> <SERVER_PORT> [thread|event]")
         exit(1)
 
     DB_PORT = int(argv[1])
     SERVER_PORT = int(argv[2])
-    server = Server(SERVER_HOST, SERVER_PORT)
+    if len(argv) == 4:
+        SERVER_MODE = argv[3]
+
+    if SERVER_MODE == "event":
+        server = EventServer(SERVER_HOST, SERVER_PORT)
+    else:
+        server = Server(SERVER_HOST, SERVER_PORT)
     server.start()
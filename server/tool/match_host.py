@@ -0,0 +1,414 @@
+# match_host.py
+"""
+Many game matches in one thread.
+
+A MatchHost runs one selector loop for all the matches of a process:
+every match has its own listening port, every player connection is a
+non-blocking socket, and the matches' ticks are timers of the same loop.
+Thread count stays the same no matter how many rooms are live.
+
+Games subclass Match and register it with get_match_host().add(); all
+Match hooks run on the loop thread and must not block. Messages use the
+same framing, codecs and compression as common_protocol. An error while
+serving a connection or a hook ends that match only, the loop goes on.
+"""
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from tool.common_protocol import (
+    HEADER, LENGTH_MASK, MAX_MESSAGE, IOV_MAX, get_channel, set_nodelay,
+    set_codec, set_compression, hello_reply
+)
+from tool.tick_scheduler import TickScheduler, MAX_CATCH_UP
+
+RECV_SIZE = 64 * 1024
+MAX_BACKLOG = 1024 * 1024   # bytes queued for a peer before it is dropped
+LINGER = 2.0                # seconds a finished match waits for its last sends
+
+
+# ==================================================
+#                  Match
+# ==================================================
+
+class Match:
+    """
+    Base class of a hosted game. Override the on_* hooks and tick();
+    tick() runs tick_rate times a second from registration until
+    finish() is called, on a fixed grid (tool.tick_scheduler): ticks a
+    busy loop delayed are caught up, at most max_catch_up at once, and
+    scheduler.stats() tells how the ticks kept up. With greet set, a
+    connection joins after its first message, which answers a HELLO
+    handshake (see common_protocol).
+    """
+    tick_rate = 20          # ticks per second
+    max_catch_up = MAX_CATCH_UP
+    max_players = 2         # the port stops accepting while full
+    greet = True
+
+    def __init__(self):
+        self.host = None
+        self.players = []   # joined Peers in join order
+        self.waiting = []   # connected Peers that did not join yet
+        self.finished = False
+        self.scheduler = TickScheduler(self.tick_rate, self.max_catch_up)
+
+    def on_join(self, player):
+        pass
+
+    def on_message(self, player, msg):
+        pass
+
+    def on_leave(self, player):
+        pass
+
+    def tick(self):
+        pass
+
+    def broadcast(self, obj):
+        for player in self.players:
+            player.send(obj)
+
+    def finish(self):
+        """End the match: stop ticking and close its connections once sent."""
+        if not self.finished:
+            self.finished = True
+            self.host._finish(self)
+
+
+class Peer:
+    """A player connection of a match."""
+    def __init__(self, host, match, conn, addr):
+        self.host = host
+        self.match = match
+        self.conn = conn
+        self.addr = addr
+        self.channel = get_channel(conn)
+        self.inbuf = bytearray()
+        self.out = deque()      # memoryviews still to send
+        self.out_size = 0
+        self.writing = False    # registered for EVENT_WRITE
+        self.closing = False    # close once out is sent
+        self.closed = False
+
+    def send(self, obj):
+        if not self.closed and not self.closing:
+            self.host._queue(self, self.channel.pack(obj))
+
+
+# ==================================================
+#                  MatchHost
+# ==================================================
+
+class MatchHost:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []        # heap of (deadline, seq, callback)
+        self.seq = itertools.count()
+        self.added = deque()    # (match, listening socket) from other threads
+        self.listeners = {}     # match -> listening socket
+        self.paused = set()     # matches whose listener is full (not selected)
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, match, ip, port):
+        """Host match on ip:port. Thread-safe, the port is bound before it returns."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, port))
+        sock.listen(match.max_players)
+        sock.setblocking(False)
+        match.host = self
+        self.added.append((match, sock))
+        self._wake()
+
+    def call_at(self, deadline, callback):
+        """Run callback on the loop at time.monotonic() deadline."""
+        heapq.heappush(self.timers, (deadline, next(self.seq), callback))
+
+    # -------------------------
+    # Loop
+    # -------------------------
+    def run(self):
+        while True:
+            timeout = None
+            if self.timers:
+                timeout = max(0.0, self.timers[0][0] - time.monotonic())
+            for key, events in self.selector.select(timeout):
+                data = key.data
+                if data == "wake":
+                    self._take_added()
+                elif isinstance(data, Peer):
+                    self._guard(data.match, self._serve_peer, data, events)
+                else:
+                    self._guard(data, self._accept, data)
+            self._run_timers()
+
+    def _serve_peer(self, peer, events):
+        if events & selectors.EVENT_WRITE:
+            self._flush(peer)
+        if events & selectors.EVENT_READ:
+            self._read(peer)
+
+    def _guard(self, match, func, *args):
+        """Run loop work of one match; an unexpected error ends that match only."""
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"[MATCH HOST] {type(match).__name__} failed: {type(e).__name__}: {e}")
+            if not match.finished:
+                match.finish()
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b"\0")
+        except BlockingIOError:
+            pass    # loop already has pending wake-ups
+
+    def _take_added(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.added:
+            match, sock = self.added.popleft()
+            self.listeners[match] = sock
+            self.selector.register(sock, selectors.EVENT_READ, match)
+            self._schedule_tick(match)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self.timers)
+            try:
+                callback()
+            except Exception as e:
+                print(f"[MATCH HOST] timer error: {type(e).__name__}: {e}")
+
+    def _schedule_tick(self, match):
+        scheduler = match.scheduler
+        def run():
+            for _ in range(scheduler.due()):
+                if match.finished:
+                    return
+                scheduler.measure(self._call, match, match.tick)
+            if not match.finished:
+                self.call_at(scheduler.deadline(), run)
+        scheduler.start()
+        self.call_at(scheduler.deadline(), run)
+
+    def _call(self, match, hook, *args):
+        """Run a Match hook; a failing match is ended, the loop goes on."""
+        try:
+            hook(*args)
+        except Exception as e:
+            print(f"[MATCH HOST] {type(match).__name__} error: {e}")
+            match.finish()
+
+    # -------------------------
+    # Connections
+    # -------------------------
+    def _accept(self, match):
+        sock = self.listeners.get(match)
+        if sock is None:
+            return
+        try:
+            conn, addr = sock.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        set_nodelay(conn)
+        peer = Peer(self, match, conn, addr)
+        self.selector.register(conn, selectors.EVENT_READ, peer)
+        match.waiting.append(peer)
+        if len(match.players) + len(match.waiting) >= match.max_players:
+            self._pause_listener(match)
+        if not match.greet:
+            self._join(peer)
+
+    def _join(self, peer):
+        match = peer.match
+        match.waiting.remove(peer)
+        match.players.append(peer)
+        self._call(match, match.on_join, peer)
+
+    def _pause_listener(self, match):
+        """Stop accepting for a full match, the port stays bound."""
+        sock = self.listeners.get(match)
+        if sock and match not in self.paused:
+            self.selector.unregister(sock)
+            self.paused.add(match)
+
+    def _resume_listener(self, match):
+        """A seat came free before the match filled: accept again."""
+        if match in self.paused:
+            self.paused.discard(match)
+            self.selector.register(self.listeners[match], selectors.EVENT_READ, match)
+
+    def _close_listener(self, match):
+        sock = self.listeners.pop(match, None)
+        if sock:
+            if match in self.paused:
+                self.paused.discard(match)
+            else:
+                self.selector.unregister(sock)
+            sock.close()
+
+    def _read(self, peer):
+        if peer.closed:
+            return
+        try:
+            data = peer.conn.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(peer)
+            return
+
+        buf = peer.inbuf
+        buf += data
+        pos = 0
+        while len(buf) - pos >= HEADER.size and not peer.closed:
+            header = HEADER.unpack_from(buf, pos)[0]
+            if header & LENGTH_MASK > MAX_MESSAGE:
+                # never buffer towards a frame that big
+                print(f"[MATCH HOST] {peer.addr}: message too large")
+                self._drop(peer)
+                return
+            end = pos + HEADER.size + (header & LENGTH_MASK)
+            if len(buf) < end:
+                break
+            body = bytes(buf[pos + HEADER.size:end])
+            pos = end
+            try:
+                msg = peer.channel.unpack(header, body)
+            except Exception as e:
+                print(f"[MATCH HOST] {peer.addr}: bad message: {e}")
+                self._drop(peer)
+                return
+            self._dispatch(peer, msg)
+        del buf[:pos]
+
+    def _dispatch(self, peer, msg):
+        match = peer.match
+        hello = isinstance(msg, dict) and msg.get("action") == "HELLO"
+        if hello:
+            # the answer still goes out in the old codec
+            reply = hello_reply(msg)
+            peer.send(reply)
+            set_codec(peer.conn, reply["codec"])
+            set_compression(peer.conn, reply["compress"])
+        if match.finished:
+            return
+        if peer in match.waiting:
+            self._join(peer)
+        if not hello and not peer.closed:
+            self._call(match, match.on_message, peer, msg)
+
+    def _queue(self, peer, parts):
+        for part in parts:
+            if len(part):
+                peer.out.append(memoryview(part))
+                peer.out_size += len(part)
+        if peer.out_size > MAX_BACKLOG:
+            print(f"[MATCH HOST] {peer.addr}: too slow, dropped")
+            self._drop(peer)
+            return
+        if not peer.writing:
+            self._flush(peer)
+
+    def _flush(self, peer):
+        out = peer.out
+        try:
+            while out:
+                if hasattr(peer.conn, "sendmsg"):
+                    sent = peer.conn.sendmsg(list(itertools.islice(out, IOV_MAX)))
+                else:
+                    sent = peer.conn.send(out[0])
+                peer.out_size -= sent
+                while out and sent >= len(out[0]):
+                    sent -= len(out[0])
+                    out.popleft()
+                if out and sent:
+                    out[0] = out[0][sent:]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(peer)
+            return
+
+        if out and not peer.writing:
+            self.selector.modify(peer.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, peer)
+            peer.writing = True
+        elif not out:
+            if peer.closing:
+                self._close(peer)
+            elif peer.writing:
+                self.selector.modify(peer.conn, selectors.EVENT_READ, peer)
+                peer.writing = False
+
+    def _drop(self, peer):
+        """The peer went away (or misbehaved): close it and tell its match."""
+        if peer.closed:
+            return
+        self._close(peer)
+        match = peer.match
+        if peer in match.waiting:
+            # left before joining (no HELLO yet): free its seat
+            match.waiting.remove(peer)
+            if not match.finished:
+                self._resume_listener(match)
+            return
+        if peer in match.players:
+            match.players.remove(peer)
+        if not match.finished:
+            self._call(match, match.on_leave, peer)
+
+    def _close(self, peer):
+        if peer.closed:
+            return
+        peer.closed = True
+        try:
+            self.selector.unregister(peer.conn)
+        except (KeyError, ValueError):
+            pass
+        peer.conn.close()
+
+    def _finish(self, match):
+        self._close_listener(match)
+        for peer in match.players + match.waiting:
+            peer.closing = True
+            if not peer.out:
+                self._close(peer)
+        # peers still sending get LINGER seconds
+        self.call_at(time.monotonic() + LINGER, lambda: self._close_all(match))
+
+    def _close_all(self, match):
+        for peer in match.players + match.waiting:
+            self._close(peer)
+
+
+_host = None
+_host_lock = threading.Lock()
+
+def get_match_host() -> MatchHost:
+    """The MatchHost of this process, started on first use."""
+    global _host
+    with _host_lock:
+        if _host is None:
+            _host = MatchHost()
+            _host.start()
+        return _host
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import textwrap
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tool.game_control import GameControl
+
+MAIN = textwrap.dedent('''
+    import os, sys
+    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+    if CURRENT_DIR not in sys.path:
+        sys.path.insert(0, CURRENT_DIR)
+
+    class Game:
+        def __init__(self, name, version, num_player):
+            self.ran = None
+
+        def setIP(self, host, port):
+            pass
+
+        def server_start(self):
+            from server import VERSION
+            self.ran = VERSION
+''')
+
+
+class GameControlVersionsTest(unittest.TestCase):
+    """Rooms of a game run from per-version checkout folders, one after another."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for version in ("1.0.0", "1.0.1"):
+            folder = os.path.join(self.root, "checkouts", version, "G")
+            os.makedirs(folder)
+            with open(os.path.join(folder, "main.py"), "w") as f:
+                f.write(MAIN)
+            with open(os.path.join(folder, "server.py"), "w") as f:
+                f.write(f"VERSION = {version!r}\n")
+        self.path = list(sys.path)
+
+    def tearDown(self):
+        sys.path[:] = self.path
+        sys.modules.pop("server", None)
+        self.tmp.cleanup()
+
+    def start(self, version):
+        base_dir = os.path.join(self.root, "checkouts", version)
+        control = GameControl("G", host="127.0.0.1", port=0, base_dir=base_dir)
+        control.start_server()
+        return control.game_instance.ran
+
+    def test_each_room_runs_its_version(self):
+        self.assertEqual(self.start("1.0.0"), "1.0.0")
+        self.assertEqual(self.start("1.0.1"), "1.0.1")
+        self.assertEqual(self.start("1.0.0"), "1.0.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
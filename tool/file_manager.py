@@ -1,11 +1,26 @@
 import os
 import json, shutil
-from tool.common_protocol import send_json, recv_json, send_file, recv_file
+import threading
+import tarfile
+import hashlib
+import zlib
+from tool.common_protocol import send_json, recv_json, send_file, send_file_path, recv_file, recv_to_file
+from tool.common_protocol import get_channel, ChunkWriter, ChunkReader, FILE_CHUNK
 
 # Path Setting
 DIR_NAME = 'games'
 CONFIG_FILE = 'config.json'
 
+# Folder transfer modes the sender offers. "tar" streams the whole folder
+# as one archive, "files" sends one header + body per file.
+TRANSFER_MODES = ("tar", "files")
+
+# Games are received into PARTIAL_DIR/<game> and moved into place only
+# once complete. Manifests carry a crc32 per CRC_CHUNK of each file, so an
+# interrupted transfer resumes from the last chunk that arrived intact.
+PARTIAL_DIR = ".partial"
+CRC_CHUNK = 1024 * 1024
+
 
 # ==================================================
 #                  FileManger
@@ -25,16 +40,7 @@ class FileManager:
     # Client: find folder by game name
     # -------------------------
     def _find_game_dir(self, game_name):
-        for root, dirs, files in os.walk(self.base_dir):
-            if CONFIG_FILE in files:
-                try:
-                    with open(os.path.join(root, CONFIG_FILE), "r") as f:
-                        config = json.load(f)
-                    if config.get("name") == game_name:
-                        return root
-                except:
-                    continue
-        return None
+        return get_catalog(self.base_dir).path(game_name)
 
     # -------------------------
     # Validate config
@@ -56,34 +62,55 @@ class FileManager:
             config["developer"] = self.developer_id
             with open(config_file, "w") as f:
                 json.dump(config, f, indent=4)
+            get_catalog(self.base_dir).invalidate()
 
         return True, config
 
     # -------------------------
     # Upload folder recursively (client)
     # -------------------------
-    def _upload_folder(self, folder_path):
+    def _upload_folder(self, folder_path, rel_paths=None, offsets=None):
         # Tell server that file transfer is starting
         send_json(self.conn, {"_type": "FILE_TRANSFER_BEGIN"})
 
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, folder_path)
-
-                with open(file_path, "rb") as f:
-                    file_bytes = f.read()
-                    send_file(self.conn, rel_path, file_bytes)
+        offsets = offsets or {}
+        for rel_path, file_path in _folder_files(folder_path, rel_paths):
+            send_file_path(self.conn, rel_path, file_path, offsets.get(rel_path, 0))
 
         # Tell server all files are done
         send_json(self.conn, {"_type": "FILE_TRANSFER_END"})
 
         print(f"Folder '{folder_path}' uploaded successfully.")
 
+    # -------------------------
+    # Upload folder as one tar stream (client)
+    # -------------------------
+    def _upload_archive(self, folder_path, rel_paths=None):
+        ch = get_channel(self.conn, create=False)
+        compress = bool(ch and ch.compress)
+        send_json(self.conn, {"_type": "ARCHIVE_BEGIN", "compressed": compress})
+
+        writer = ChunkWriter(self.conn, compress)
+        count = 0
+        # GNU headers and no owner lookups: one 512-byte header per file
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+            for rel_path, file_path in _folder_files(folder_path, rel_paths):
+                with open(file_path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    info = tarfile.TarInfo(rel_path.replace(os.sep, "/"))
+                    info.size = st.st_size
+                    info.mtime = int(st.st_mtime)
+                    info.mode = st.st_mode & 0o777
+                    tar.addfile(info, f)
+                count += 1
+        writer.close()
+
+        print(f"Folder '{folder_path}' uploaded successfully ({count} files).")
+
     # -------------------------
     # Receive folder (server)
     # -------------------------
-    def _receive_folder(self, save_dir):
+    def _receive_folder(self, save_dir, manifest=None):
         os.makedirs(save_dir, exist_ok=True)
         print(f"Receiving files into '{save_dir}'...")
 
@@ -106,24 +133,68 @@ class FileManager:
 
             filename = header["filename"]
             size = header["size"]
-
-            # Receive file body
-            final_path = os.path.join(save_dir, filename)
+            offset = header.get("offset", 0)
+
+            # Receive file body (the body must be read even if skipped)
+            final_path = _safe_join(save_dir, filename)
+            if final_path is None:
+                print(f"Skipped unsafe path: {filename}")
+                recv_to_file(self.conn, _Discard(), size, header.get("compressed", False))
+                continue
             os.makedirs(os.path.dirname(final_path), exist_ok=True)
 
-            received = 0
-            with open(final_path, "wb") as f:
-                while received < size:
-                    chunk = self.conn.recv(min(4096, size - received))
-                    if not chunk:
-                        raise ConnectionError("Connection dropped during file receive")
-                    f.write(chunk)
-                    received += len(chunk)
+            with _open_at(final_path, offset) as f:
+                writer = _CheckedWriter(f, filename, manifest, offset)
+                recv_to_file(self.conn, writer, size, header.get("compressed", False))
+                writer.finish()
 
             print(f"Received file: {filename}")
 
         print(f"All files for '{save_dir}' received.")
 
+    # -------------------------
+    # Receive folder as one tar stream (server)
+    # -------------------------
+    def _receive_archive(self, save_dir, manifest=None):
+        os.makedirs(save_dir, exist_ok=True)
+        print(f"Receiving archive into '{save_dir}'...")
+
+        msg = recv_json(self.conn)
+        if not msg or msg.get("_type") != "ARCHIVE_BEGIN":
+            raise ValueError("Expected ARCHIVE_BEGIN")
+
+        reader = ChunkReader(self.conn, msg.get("compressed", False))
+        count = 0
+        made_dirs = {save_dir}
+        with tarfile.open(fileobj=reader, mode="r|") as tar:
+            for member in tar:
+                # only plain files and folders, and only inside save_dir
+                final_path = _safe_join(save_dir, member.name)
+                if final_path is None:
+                    print(f"Skipped unsafe path: {member.name}")
+                    continue
+                if member.isdir():
+                    os.makedirs(final_path, exist_ok=True)
+                    made_dirs.add(final_path)
+                    continue
+                if not member.isfile():
+                    print(f"Skipped non-regular file: {member.name}")
+                    continue
+
+                parent = os.path.dirname(final_path)
+                if parent not in made_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    made_dirs.add(parent)
+                with tar.extractfile(member) as src, _open_new(final_path) as dst:
+                    writer = _CheckedWriter(dst, member.name, manifest)
+                    shutil.copyfileobj(src, writer, FILE_CHUNK)
+                    writer.finish()
+                count += 1
+        # tar stops at its end blocks, skip the record padding after them
+        reader.drain()
+
+        print(f"All {count} files for '{save_dir}' received.")
+
     def _delete_pycache(self):
         for root, dirs, files in os.walk(self.base_dir):
             for d in dirs[:]:
@@ -138,7 +209,11 @@ class FileManager:
     # =========================
     # Client function
     # =========================
-    def upload_game(self, game_name=None):
+    def upload_game(self, game_name=None, manifest=None):
+        """
+        Send a game folder. manifest, if given, is used instead of hashing
+        the folder (e.g. a stored version whose files never change).
+        """
         if not game_name:
             game_name = input("Enter Game Name to upload: ")
 
@@ -157,8 +232,18 @@ class FileManager:
         print("     Game Uplaoad Start     ")
         print("============================")
         
+        # delete __pycache__
+        self._delete_pycache()
+        if manifest is None:
+            manifest = get_catalog(self.base_dir).manifest(config_or_msg["name"])
+
         # Send metadata using send_json
-        send_json(self.conn, {"name": config_or_msg["name"], "version": config_or_msg["version"]})
+        send_json(self.conn, {
+            "name": config_or_msg["name"],
+            "version": config_or_msg["version"],
+            "modes": list(TRANSFER_MODES),
+            "manifest": manifest,
+        })
 
         # Wait server OK
         resp = recv_json(self.conn)
@@ -166,11 +251,22 @@ class FileManager:
             print("Server rejected metadata:", resp.get("msg"))
             return False
 
-        # delete __pycache__
-        self._delete_pycache()
+        # Receivers holding an older copy answer the files they are
+        # missing, older receivers answer neither a list nor a mode
+        need = resp.get("need")
+        if need is not None:
+            need = [p for p in need if p in manifest]
+            print(f"[FileManager] Sending {len(need)} of {len(manifest)} files.")
+
+        # and where a file they hold part of can be continued
+        offsets = valid_offsets(resp.get("offsets"), manifest)
+        if offsets:
+            print(f"[FileManager] Resuming {len(offsets)} files.")
 
-        # Upload all files
-        self._upload_folder(folder_path)
+        if resp.get("mode", "files") == "tar":
+            self._upload_archive(folder_path, need)
+        else:
+            self._upload_folder(folder_path, need, offsets)
 
         print("============================")
         print("     Game Upload Finished   ")
@@ -187,23 +283,35 @@ class FileManager:
         print("============================")
         # Receive metadata using recv_json
         metadata = recv_json(self.conn)
-        if not metadata or "name" not in metadata or "version" not in metadata:
+        if (not metadata or "version" not in metadata
+                or not _is_game_name(metadata.get("name"))):
             send_json(self.conn, {"status": "FAIL", "msg": "Invalid metadata"})
             return False
 
         game_name = metadata["name"]
-        save_dir = os.path.join(self.base_dir, game_name)
-        send_json(self.conn, {"status": "OK", "msg": "Ready to receive files"})
-
-        # Receive all files
         self._delete_pycache()
-        try:
-            print("[FileManager] Remove Game Files.")
-            remove_games(self.base_dir, game_name)
-        except:
-            print("[FileManager] There is nothing to remove.")
-
-        self._receive_folder(save_dir)
+        manifest = metadata.get("manifest")
+        staging, need, offsets = prepare_staging(self.base_dir, game_name, manifest)
+        reply = {"status": "OK", "msg": "Ready to receive files"}
+        if need is not None:
+            reply["need"] = need
+
+        # tar pays a 512-byte header and padding per file, which only
+        # pays off when the stream is compressed. It can't start mid-file.
+        offered = metadata.get("modes", ["files"])
+        ch = get_channel(self.conn, create=False)
+        mode = "tar" if "tar" in offered and ch and ch.compress and not offsets else "files"
+        reply["mode"] = mode
+        if offsets:
+            reply["offsets"] = offsets
+        send_json(self.conn, reply)
+
+        if mode == "tar":
+            self._receive_archive(staging, manifest)
+        else:
+            self._receive_folder(staging, manifest)
+
+        install_staging(self.base_dir, game_name)
         
         print("============================")
         print("     Game Download End      ")
@@ -211,77 +319,481 @@ class FileManager:
         return True
 
 
+# ==================================================
+#                  Staging
+# ==================================================
+
+def prepare_staging(base_dir, game_name, manifest):
+    """
+    Get the staging folder base_dir/.partial/<game> ready to receive a
+    game described by manifest. Returns (staging, need, offsets): the
+    files still to receive and where partly received ones continue.
+
+    Files are written into the staging folder, which replaces the game
+    folder (install_staging) once the transfer is complete, so a broken
+    transfer never leaves a half-written game behind. A staging folder
+    left by such a transfer is resumed, otherwise it starts as hardlinks
+    of the local copy (if any), so only changed files have to be sent.
+    Without a manifest (older senders) every file is sent again and need
+    is None. game_name comes from the peer and must be a single path
+    component, ValueError otherwise.
+    """
+    _check_game_name(game_name)
+    catalog = get_catalog(base_dir)
+    staging = os.path.join(base_dir, PARTIAL_DIR, game_name)
+    if manifest is None:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        return staging, None, {}
+
+    if not os.path.isdir(staging):
+        _link_tree(catalog.path(game_name), staging)
+    staged = build_manifest(staging, catalog.hashes)
+    need = [p for p, entry in manifest.items() if not _same_file(staged.get(p), entry)]
+    offsets = {}
+    for rel_path in need:
+        offset = _resume_offset(staging, rel_path, manifest[rel_path], staged.get(rel_path))
+        if offset:
+            offsets[rel_path] = offset
+    removed = [p for p in staged if p not in manifest]
+    print(f"[FileManager] Update {len(need)} files ({len(offsets)} resumed), remove {len(removed)} files.")
+    _remove_files(staging, removed)
+    return staging, need, offsets
+
+
+def install_staging(base_dir, game_name):
+    """Move the complete staging folder of a game into place."""
+    _check_game_name(game_name)
+    catalog = get_catalog(base_dir)
+    local_dir = catalog.path(game_name)
+    save_dir = os.path.join(base_dir, game_name)
+    staging = os.path.join(base_dir, PARTIAL_DIR, game_name)
+
+    _replace_dir(staging, save_dir)
+    try:
+        os.rmdir(os.path.dirname(staging))
+    except OSError:
+        pass
+    # a copy of the game in a folder of another name
+    if local_dir and os.path.normpath(local_dir) != os.path.normpath(save_dir):
+        shutil.rmtree(local_dir, ignore_errors=True)
+    catalog.invalidate()
+
+
+def valid_offsets(offsets, manifest):
+    """The resume offsets a receiver asked for that fit the files of manifest."""
+    valid = {}
+    if not isinstance(offsets, dict):
+        return valid
+    for rel_path, offset in offsets.items():
+        if rel_path in manifest and isinstance(offset, int) and 0 < offset <= manifest[rel_path]["size"]:
+            valid[rel_path] = offset
+    return valid
+
+
+# ==================================================
+#                  GameCatalog
+# ==================================================
+
+class GameCatalog:
+    """
+    Cached view of the games under base_dir.
+
+    Every config.json is parsed once and kept by game name and by
+    developer, so lookups and listings don't rescan the folder. The cache
+    is rebuilt when the mtime of base_dir changes (a game folder was added
+    or removed) or after invalidate(), which is called whenever a game is
+    written, rewritten or removed through this module. get() also re-reads
+    one config whose file changed in place.
+    """
+    def __init__(self, base_dir, config_name=CONFIG_FILE):
+        self.base_dir = base_dir
+        self.config_name = config_name
+        self.lock = threading.RLock()
+        self.games = {}             # name -> {"path", "config", "mtime"}
+        self.by_developer = {}      # developer -> {name: entry}
+        self.dir_mtime = None       # None -> rebuild on next access
+        self.hashes = {}            # (st_dev, st_ino) -> (size, mtime_ns, sha256, crc32s)
+
+    def invalidate(self):
+        with self.lock:
+            self.dir_mtime = None
+
+    # -------------------------
+    # Query
+    # -------------------------
+    def get(self, name):
+        """Config of the game (a copy), or None."""
+        with self.lock:
+            self._refresh()
+            entry = self.games.get(name)
+            if entry and self._config_mtime(entry["path"]) != entry["mtime"]:
+                self._reload()
+                entry = self.games.get(name)
+            return dict(entry["config"]) if entry else None
+
+    def path(self, name):
+        """Folder of the game, or None."""
+        with self.lock:
+            self._refresh()
+            entry = self.games.get(name)
+            return entry["path"] if entry else None
+
+    def list(self, developer=None):
+        """Configs (copies) of all games, or of one developer's games."""
+        with self.lock:
+            self._refresh()
+            entries = self.games if developer is None else self.by_developer.get(developer, {})
+            return [dict(entry["config"]) for entry in entries.values()]
+
+    def manifest(self, name):
+        """
+        Manifest of the game's files (see build_manifest), or None.
+        Hashes are kept across calls and only recomputed for files whose
+        size or mtime changed.
+        """
+        folder_path = self.path(name)
+        if folder_path is None:
+            return None
+        return build_manifest(folder_path, self.hashes)
+
+    # -------------------------
+    # Internal
+    # -------------------------
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.base_dir).st_mtime_ns
+        except OSError:
+            mtime = -1   # folder missing, the catalog is empty
+        if mtime != self.dir_mtime:
+            self._reload()
+            self.dir_mtime = mtime
+
+    def _config_mtime(self, folder_path):
+        try:
+            return os.stat(os.path.join(folder_path, self.config_name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload(self):
+        self.games = {}
+        self.by_developer = {}
+        if not os.path.isdir(self.base_dir):
+            return
+
+        for folder in os.listdir(self.base_dir):
+            folder_path = os.path.join(self.base_dir, folder)
+            config_path = os.path.join(folder_path, self.config_name)
+            if not os.path.isfile(config_path):
+                # Skip folders without config
+                continue
+
+            try:
+                mtime = self._config_mtime(folder_path)
+                with open(config_path, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            except Exception as e:
+                print(f"Error reading {config_path}: {e}")
+                continue
+
+            name = config.get("name")
+            if name is None or name in self.games:
+                continue
+
+            entry = {"path": folder_path, "config": config, "mtime": mtime}
+            self.games[name] = entry
+            self.by_developer.setdefault(config.get("developer"), {})[name] = entry
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(base_dir="games", config_name=CONFIG_FILE) -> GameCatalog:
+    """Shared GameCatalog of a games folder (one per folder and process)."""
+    key = (os.path.abspath(base_dir), config_name)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = GameCatalog(base_dir, config_name)
+        return _catalogs[key]
+
+
 # ==================================================
 #             Useful Function
 # ==================================================
 
-def list_games(base_dir="games", config_name=CONFIG_FILE, type='name'):
+# ==================================================
+#                  Manifest
+# ==================================================
+
+def file_hashes(path):
+    """sha256 of the file and crc32 of each CRC_CHUNK of it."""
+    h = hashlib.sha256()
+    crcs = []
+    crc = 0
+    filled = 0
+    buf = bytearray(FILE_CHUNK)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            pos = 0
+            while pos < n:
+                take = min(n - pos, CRC_CHUNK - filled)
+                crc = zlib.crc32(view[pos:pos + take], crc)
+                filled += take
+                pos += take
+                if filled == CRC_CHUNK:
+                    crcs.append(crc)
+                    crc = filled = 0
+    if filled:
+        crcs.append(crc)
+    return h.hexdigest(), crcs
+
+
+def build_manifest(folder_path, cache=None):
     """
-    Scan the base_dir for all game folders, read each folder's config.json,
-    and return a list of game names found inside the configuration.
+    Describe every file under folder_path (except __pycache__):
+        {"assets/a.png": {"size": 1234, "sha256": "...", "crc32": [...]}, ...}
+    Paths are relative with "/" separators, crc32 has one entry per
+    CRC_CHUNK. cache, if given, maps a file (st_dev, st_ino) to
+    (size, mtime_ns, sha256, crc32s) and is used and updated so unchanged
+    files, and hardlinks of them, are not hashed again.
+    """
+    manifest = {}
+    for rel_path, file_path in _folder_files(folder_path):
+        st = os.stat(file_path)
+        key = (st.st_dev, st.st_ino)
+        cached = cache.get(key) if cache is not None else None
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            digest, crcs = cached[2], cached[3]
+        else:
+            digest, crcs = file_hashes(file_path)
+            if cache is not None:
+                cache[key] = (st.st_size, st.st_mtime_ns, digest, crcs)
+        manifest[rel_path] = {"size": st.st_size, "sha256": digest, "crc32": crcs}
+    return manifest
+
+
+def _same_file(a, b):
+    """Whether two manifest entries describe the same content."""
+    return a is not None and b is not None and a["size"] == b["size"] and a["sha256"] == b["sha256"]
+
+
+def _resume_offset(folder_path, rel_path, entry, staged):
+    """
+    Where the transfer of a partly received file can continue: the end of
+    its leading CRC_CHUNKs that match entry. 0 if it must be sent again.
+    Hardlinked files are never resumed, they are shared with another copy.
+    """
+    crcs = entry.get("crc32")
+    if not crcs or staged is None or staged["size"] >= entry["size"]:
+        return 0
+    try:
+        if os.stat(os.path.join(folder_path, *rel_path.split("/"))).st_nlink > 1:
+            return 0
+    except OSError:
+        return 0
+
+    good = 0
+    for have, want in zip(staged["crc32"][:staged["size"] // CRC_CHUNK], crcs):
+        if have != want:
+            break
+        good += 1
+    return good * CRC_CHUNK
 
-    Returns:
-        game_list (list): ["My RPG", "Space Shooter", ...]
+
+def _folder_files(folder_path, rel_paths=None):
     """
-    if not os.path.isdir(base_dir):
-        print(f"Base directory '{base_dir}' does not exist.")
-        return []
+    Yield (relative path with "/", full path) of the files under
+    folder_path, skipping __pycache__, or of the given relative paths.
+    """
+    if rel_paths is not None:
+        for rel_path in rel_paths:
+            yield rel_path, os.path.join(folder_path, *rel_path.split("/"))
+        return
 
-    game_list = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        for file in files:
+            file_path = os.path.join(root, file)
+            rel_path = os.path.relpath(file_path, folder_path).replace(os.sep, "/")
+            yield rel_path, file_path
 
-    for folder in os.listdir(base_dir):
-        folder_path = os.path.join(base_dir, folder)
 
-        if not os.path.isdir(folder_path):
-            continue
+def _open_new(path):
+    """
+    Open path for writing as a new file. An existing file is unlinked
+    first, so files hardlinked elsewhere (server blob store) stay intact.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    return open(path, "wb")
 
-        config_path = os.path.join(folder_path, config_name)
 
-        if not os.path.isfile(config_path):
-            # Skip folders without config
-            continue
+def _open_at(path, offset):
+    """Open path to continue writing at offset, or as a new file if 0."""
+    if not offset:
+        return _open_new(path)
+    f = open(path, "r+b")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
 
-        # Load config.json
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            # Extract game name
-            if type is None or type in config:
-                if type:
-                    game_list.append(config[type])
-                else:
-                    game_list.append(config)
-            else:
-                print(f"Warning: {config_path} missing 'name' field, skipping.")
-        except Exception as e:
-            print(f"Error reading {config_path}: {e}")
-
-    # return sorted(game_list)
-    return game_list
+
+class _CheckedWriter:
+    """
+    File wrapper checking the bytes written against the crc32 list of the
+    file's manifest entry, starting at offset (a multiple of CRC_CHUNK).
+    Raises ValueError on the first chunk that does not match.
+    """
+    def __init__(self, f, rel_path, manifest, offset=0):
+        self.f = f
+        self.rel_path = rel_path
+        entry = (manifest or {}).get(rel_path) or {}
+        self.crcs = entry.get("crc32") if offset % CRC_CHUNK == 0 else None
+        self.index = offset // CRC_CHUNK
+        self.crc = 0
+        self.filled = 0
+
+    def write(self, data):
+        n = self.f.write(data)
+        if self.crcs is not None:
+            view = memoryview(data)
+            pos = 0
+            while pos < len(view):
+                take = min(len(view) - pos, CRC_CHUNK - self.filled)
+                self.crc = zlib.crc32(view[pos:pos + take], self.crc)
+                self.filled += take
+                pos += take
+                if self.filled == CRC_CHUNK:
+                    self._check()
+        return n
+
+    def finish(self):
+        if self.crcs is not None:
+            if self.filled:
+                self._check()
+            if self.index != len(self.crcs):
+                raise ValueError(f"{self.rel_path} is incomplete")
+
+    def _check(self):
+        if self.index >= len(self.crcs) or self.crcs[self.index] != self.crc:
+            raise ValueError(f"Checksum mismatch in {self.rel_path} at {self.index * CRC_CHUNK}")
+        self.index += 1
+        self.crc = self.filled = 0
+
+
+class _Discard:
+    def write(self, data):
+        return len(data)
+
+
+def _safe_join(folder_path, rel_path):
+    """
+    folder_path joined with a received relative path, or None if the path
+    would leave folder_path. No links are ever created, so a lexical check
+    is enough.
+    """
+    rel_path = os.path.normpath(rel_path)
+    if (os.path.isabs(rel_path) or os.path.splitdrive(rel_path)[0]
+            or rel_path == ".." or rel_path.startswith(".." + os.sep)):
+        return None
+    return os.path.join(folder_path, rel_path)
 
 
-def remove_games(base_dir='games', game_name=''):
-    for game in os.listdir(base_dir):
-        path = os.path.join(base_dir, game)
-        cfg_path = os.path.join(path, "config.json")
-        if not os.path.isfile(cfg_path):
-            continue
+def _is_game_name(name):
+    """True if name can be the folder of a game: one path component, not the staging folder."""
+    return (isinstance(name, str) and name not in ("", ".", "..", PARTIAL_DIR)
+            and "/" not in name and "\\" not in name and "\0" not in name
+            and not os.path.splitdrive(name)[0])
+
+def _check_game_name(name):
+    if not _is_game_name(name):
+        raise ValueError(f"Invalid game name: {name!r}")
 
+
+def _link_tree(src, dest):
+    """Make dest a copy of the folder src (if any) made of hardlinks."""
+    os.makedirs(dest, exist_ok=True)
+    if not src:
+        return
+    for rel_path, file_path in _folder_files(src):
+        target = os.path.join(dest, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
         try:
-            with open(cfg_path, "r") as f:
-                cfg = json.load(f)
-        except:
+            os.link(file_path, target)
+        except OSError:
+            shutil.copy2(file_path, target)
+
+
+def _replace_dir(src, dest):
+    """Move the folder src to dest, replacing the folder there."""
+    old = None
+    if os.path.exists(dest):
+        old = src + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(dest, old)
+    os.rename(src, dest)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _remove_files(folder_path, rel_paths):
+    """Delete the given files and any folders left empty by that."""
+    for rel_path in rel_paths:
+        file_path = os.path.join(folder_path, *rel_path.split("/"))
+        try:
+            os.remove(file_path)
+        except OSError:
             continue
+        parent = os.path.dirname(file_path)
+        while os.path.normpath(parent) != os.path.normpath(folder_path):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
 
-        if cfg.get("name") == game_name:
-            found_path = path
-            found_config = cfg
-            break
+
+def list_games(base_dir="games", config_name=CONFIG_FILE, type='name'):
+    """
+    Return the games found in base_dir (served from its GameCatalog).
+
+    Returns:
+        type='name': ["My RPG", "Space Shooter", ...]
+        type=None:   [config, ...]
+        other type:  that config field of every game which has it
+    """
+    if not os.path.isdir(base_dir):
+        print(f"Base directory '{base_dir}' does not exist.")
+        return []
+
+    game_list = []
+    for config in get_catalog(base_dir, config_name).list():
+        if type is None:
+            game_list.append(config)
+        elif type in config:
+            game_list.append(config[type])
+
+    return game_list
+
+
+def remove_games(base_dir='games', game_name=''):
+    catalog = get_catalog(base_dir)
+    found_path = catalog.path(game_name)
+    if found_path is None:
+        return False
 
     try:
-        import shutil
         shutil.rmtree(found_path)
         return True
         
     except Exception as e:
-        return False
\ No newline at end of file
+        return False
+    finally:
+        catalog.invalidate()